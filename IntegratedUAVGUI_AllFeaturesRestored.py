@@ -11,6 +11,8 @@ import threading
 import random
 import time
 import json
+from UAV_Control import ControlClient
+from UAV_IOCore import IOCore
 
 # === Constants ===
 SERIAL_PORT = 'COM6'
@@ -159,6 +161,10 @@ class IntegratedUAVGUI:
                                           command=self.toggle_mode)
         self.sim_toggle.grid(row=0, column=1, sticky='e')
 
+        # Pauses/resumes the serial simulator (Serial_Simulator_Toggle_Fixed.py) over its control socket
+        self.io_core = IOCore().start()
+        self.sim_control = ControlClient(self.io_core)
+
         self.running = True
         self.reader_thread = threading.Thread(target=self.data_loop, daemon=True)
         self.reader_thread.start()
@@ -215,15 +221,10 @@ class IntegratedUAVGUI:
 
     
     def toggle_mode(self):
-        import os
         print("Simulação ligada" if self.simulation_mode.get() else "Simulação desligada")
 
-        # Update sim_mode.flag file for serial simulator
-        if self.simulation_mode.get():
-            open("sim_mode.flag", "w").close()
-        else:
-            if os.path.exists("sim_mode.flag"):
-                os.remove("sim_mode.flag")
+        # The serial simulator stays quiet while the GUI simulates locally
+        self.sim_control.send("PAUSE" if self.simulation_mode.get() else "RESUME")
 
         # Restart data loop
         self.running = False
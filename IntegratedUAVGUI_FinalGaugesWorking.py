@@ -4,30 +4,258 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter.constants import GROOVE
 from tkinter import filedialog
-from tkintermapview import TkinterMapView
+from tkintermapview import TkinterMapView, decimal_to_osm
+import contextlib
 import math
-import serial
+import os
 import threading
-import random
 import time
-import json
+import argparse
+from UAV_Control import ControlClient
+from UAV_IOCore import IOCore
+from UAV_Telemetry import MissionUploader, SerialLink, SimulatedSource, TelemetryFeed, TelemetryState
+from UAV_FlightLog import LOG_EXTENSION, MAX_REPLAY_SPEED, FlightRecorder, ReplaySource
+from UAV_Export import EXPORT_FORMATS, export_logs
+from UAV_FlightSim import FlightSimulator
+from UAV_Mission import (MISSION_EXTENSION, FlightTrack, Mission, MissionFileError, MissionJournal, distance_m,
+                         load_mission, save_mission)
+from UAV_VirtualSerial import configured_port
+from UAV_MapCache import TILE_DATABASE, PREFETCH_ZOOM, mission_bounds, prefetch_tiles
 
 # === Constants ===
-SERIAL_PORT = 'COM7'
+# COM7 unless overridden by UAV_SERIAL_PORT, uav_ports.json or --port
+SERIAL_PORT = configured_port('serial_port', 'COM7')
 LOW_BATTERY_THRESHOLD = 15.0
 BAUD_RATE = 9600
+FRAME_INTERVAL_MS = 33
+SIM_RATE_HZ = 10
+RECORDINGS_DIR = "voos"
+REPLAY_UI_MS = 500
+ANALYSIS_DETAIL_S = 60.0    # full-resolution track either side of the analysis cursor
+SIM_SEED = 0
+SIM_ROUTE = [(40.971958, -8.646664), (40.972388, -8.646764), (40.972549, -8.647595),
+             (40.972021, -8.648246), (40.971531, -8.647407), (40.972080, -8.646701)]
+TRACK_SEGMENT_POINTS = 64
+FOLLOW_INNER_BOX = 0.6      # fraction of the map view the UAV may roam before the map recenters
+FOLLOW_STEP_MS = 50         # pan animation rate cap (20 steps/s)
+FOLLOW_EASING = 0.3         # fraction of the remaining offset covered per step
+FOLLOW_JUMP_VIEWS = 2.0     # farther than this (in map views) just jump instead of panning
+
+# sin/cos for every half degree, shared by the compass rose and the needle
+COMPASS_STEPS = 720
+COMPASS_TABLE = [(math.sin(2 * math.pi * i / COMPASS_STEPS), math.cos(2 * math.pi * i / COMPASS_STEPS))
+                 for i in range(COMPASS_STEPS)]
+CARDINALS = {0: "N", 90: "E", 180: "S", 270: "W"}
+
+
+def compass_point(heading, radius, center=200):
+    sin_a, cos_a = COMPASS_TABLE[round(heading * COMPASS_STEPS / 360) % COMPASS_STEPS]
+    return center + sin_a * radius, center - cos_a * radius
+
+# === Tape Gauge ===
+class TapeGauge:
+    # Ticks and labels are created once; a refresh moves the tick group and relabels only on a new decade
+    def __init__(self, canvas, center_y=110, step=10, ticks=5):
+        self.canvas = canvas
+        self.step = step
+        self.offsets = range(-ticks - 1, ticks + 2)
+        self.labels = []
+        for i in self.offsets:
+            y = center_y - i * step
+            canvas.create_line(0, y, 30, y, fill='white', tags='tape')
+            self.labels.append(canvas.create_text(35, y, text="", fill='white', anchor="w", tags='tape'))
+        canvas.create_line(0, center_y, 50, center_y, fill='red', width=2)
+        self.base = None
+        self.shift = 0.0
+
+    def set_value(self, value):
+        base = math.floor(value / self.step) * self.step
+        if base != self.base:
+            for i, label in zip(self.offsets, self.labels):
+                self.canvas.itemconfig(label, text=f"{base + i * self.step:.0f}")
+            self.base = base
+        shift = value - base
+        if shift != self.shift:
+            self.canvas.move('tape', 0, shift - self.shift)
+            self.shift = shift
+
+
+# === Track Polyline ===
+class TrackPolyline:
+    # The track is drawn as short map paths so a new fix only redraws the newest segment
+    def __init__(self, map_widget, max_points, color="blue", width=3):
+        self.map_widget = map_widget
+        self.max_segments = max(1, max_points // TRACK_SEGMENT_POINTS)
+        self.color = color
+        self.width = width
+        self.segments = []
+        self.pending = None
+
+    def add(self, lat, lon):
+        if self.segments and len(self.segments[-1].position_list) < TRACK_SEGMENT_POINTS:
+            segment = self.segments[-1]
+            segment.add_position(lat, lon)
+            segment.draw()
+            return
+        start = self.segments[-1].position_list[-1] if self.segments else self.pending
+        if start is None:
+            self.pending = (lat, lon)
+            return
+        self.segments.append(self.map_widget.set_path([start, (lat, lon)], color=self.color, width=self.width))
+        if len(self.segments) > self.max_segments:
+            self.map_widget.delete(self.segments.pop(0))
+
+    def clear(self):
+        for segment in self.segments:
+            self.map_widget.delete(segment)
+        self.segments = []
+        self.pending = None
+
+
+# === Waypoint Layer ===
+@contextlib.contextmanager
+def deferred_z_order(map_widget):
+    # tkintermapview calls map_widget.manage_z_order() after drawing every marker and path, and that lifts
+    # each tag group across the whole canvas. A no-op on the instance shadows the method while a batch is
+    # drawn; deleting it brings the class method back for the single re-sort at the end.
+    map_widget.manage_z_order = lambda: None
+    try:
+        yield
+    finally:
+        del map_widget.manage_z_order
+        map_widget.manage_z_order()
+
+
+def delete_map_items(map_widget, markers, paths):
+    # CanvasPositionMarker.delete() runs a full canvas.update() per marker. Does what the two delete()s do
+    # (canvas items, `deleted` flag, the widget's object lists) in one pass and one canvas call instead.
+    items = []
+    for marker in markers:
+        items += [marker.polygon, marker.big_circle, marker.canvas_text, marker.canvas_icon, marker.canvas_image]
+        marker.polygon = marker.big_circle = marker.canvas_text = marker.canvas_icon = marker.canvas_image = None
+        marker.deleted = True
+    for path in paths:
+        items.append(path.canvas_line)
+        path.canvas_line = None
+        path.deleted = True
+    map_widget.canvas.delete(*[item for item in items if item is not None])
+    map_widget.canvas_marker_list = [marker for marker in map_widget.canvas_marker_list if not marker.deleted]
+    map_widget.canvas_path_list = [path for path in map_widget.canvas_path_list if not path.deleted]
+
+
+class WaypointLayer:
+    # Markers keyed by waypoint id plus one path per leg, so an edit only touches its own map items
+    def __init__(self, map_widget):
+        self.map_widget = map_widget
+        self.markers = {}
+        self.legs = []
+
+    def append(self, mission):
+        index = len(mission) - 1
+        lat, lon = mission[index]
+        self.markers[mission.ids[index]] = self.map_widget.set_marker(lat, lon, text=f"WP{index + 1}")
+        if index > 0:
+            self.legs.append(self.map_widget.set_path([mission[index - 1], mission[index]]))
+
+    def load(self, mission):
+        # Whole mission in one go: old items removed in bulk, new ones drawn with a single canvas re-sort
+        self.clear()
+        with deferred_z_order(self.map_widget):
+            points = mission.points()
+            for index, (wp_id, (lat, lon)) in enumerate(zip(mission.ids, points)):
+                self.markers[wp_id] = self.map_widget.set_marker(lat, lon, text=f"WP{index + 1}")
+            self.legs = [self.map_widget.set_path([start, end]) for start, end in zip(points, points[1:])]
+
+    def move(self, mission, index):
+        index %= len(mission)
+        self.markers[mission.ids[index]].set_position(*mission[index])
+        if index > 0:
+            self.legs[index - 1].set_position_list([mission[index - 1], mission[index]])
+        if index < len(self.legs):
+            self.legs[index].set_position_list([mission[index], mission[index + 1]])
+
+    def remove(self, mission, wp_id, index):
+        # Called after mission.pop(index); `index` is where the waypoint used to be
+        self.map_widget.delete(self.markers.pop(wp_id))
+        if index < len(self.legs):
+            self.map_widget.delete(self.legs.pop(index))
+        if index > 0:
+            self.map_widget.delete(self.legs.pop(index - 1))
+            if index < len(mission):
+                self.legs.insert(index - 1, self.map_widget.set_path([mission[index - 1], mission[index]]))
+        for i in range(index, len(mission)):
+            self.markers[mission.ids[i]].set_text(f"WP{i + 1}")
+
+    def clear(self):
+        delete_map_items(self.map_widget, self.markers.values(), self.legs)
+        self.markers = {}
+        self.legs = []
+
+
+# === Map Follow ===
+class MapFollower:
+    # Recenters only when the UAV leaves the inner box, panning in cheap draw_move steps instead of set_position
+    def __init__(self, map_widget, inner_box=FOLLOW_INNER_BOX):
+        self.map_widget = map_widget
+        self.inner_box = inner_box
+        self.target = None
+        self.animating = False
+
+    def update(self, lat, lon):
+        widget = self.map_widget
+        zoom = round(widget.zoom)
+        x, y = decimal_to_osm(lat, lon, zoom)
+        (left, top), (right, bottom) = widget.upper_left_tile_pos, widget.lower_right_tile_pos
+        margin_x = (right - left) * (1 - self.inner_box) / 2
+        margin_y = (bottom - top) * (1 - self.inner_box) / 2
+        if left + margin_x <= x <= right - margin_x and top + margin_y <= y <= bottom - margin_y:
+            return
+        self.target = (lat, lon)
+        if not self.animating:
+            self.animating = True
+            widget.after(FOLLOW_STEP_MS, self.step)
+
+    def step(self):
+        widget = self.map_widget
+        if self.target is None:
+            self.animating = False
+            return
+        # Target kept in degrees so a zoom change mid-pan doesn't throw it off
+        x, y = decimal_to_osm(*self.target, round(widget.zoom))
+        (left, top), (right, bottom) = widget.upper_left_tile_pos, widget.lower_right_tile_pos
+        dx = x - (left + right) / 2
+        dy = y - (top + bottom) / 2
+        if abs(dx) > (right - left) * FOLLOW_JUMP_VIEWS or abs(dy) > (bottom - top) * FOLLOW_JUMP_VIEWS:
+            widget.set_position(*self.target)
+            self.target = None
+        else:
+            if abs(dx) < 0.02 and abs(dy) < 0.02:
+                self.target = None
+            else:
+                dx *= FOLLOW_EASING
+                dy *= FOLLOW_EASING
+            widget.upper_left_tile_pos = (left + dx, top + dy)
+            widget.lower_right_tile_pos = (right + dx, bottom + dy)
+            widget.check_map_border_crossing()
+            widget.draw_move()
+        widget.after(FOLLOW_STEP_MS, self.step)
+
+    def stop(self):
+        self.target = None
+
 
 # === UAV GUI Class ===
 class IntegratedUAVGUI:
-    def __init__(self, root):
+    def __init__(self, root, serial_port=SERIAL_PORT):
         self.root = root
         root.title("Estação Terrestre UAV")
         root.geometry("1200x600")
         root.configure(background='light grey')
         self.root.maxsize(1200, 600)
 
-        self.flight_data = {'altitude': 50.0, 'speed': 50.0, 'battery': 16.8, 'roll': 0.0, 'pitch': 0.0}
-        self.current_heading = 0
+        self.telemetry = TelemetryState(altitude=50.0, speed=50.0, battery=16.8)
+        self.drawn = None
+        self.render_pending = False
         self.simulation_mode = tk.BooleanVar(value=False)
 
         main_frame = ttk.Frame(root, borderwidth=2, relief='groove')
@@ -66,13 +294,23 @@ class IntegratedUAVGUI:
         self.notebook.add(instrument_tab, text="Instrumentos")
 
         map_tab = ttk.Frame(self.notebook)
-        self.map_widget = TkinterMapView(map_tab, width=800, height=600, corner_radius=1)
+        # Tiles come from the offline cache first and only fall back to the network when missing
+        self.map_widget = TkinterMapView(map_tab, width=800, height=600, corner_radius=1,
+                                         database_path=TILE_DATABASE)
         self.map_widget.grid(row=0, column=0)
         self.map_widget.set_position(41.002381, -8.638930)
         self.map_widget.set_zoom(16)
         self.marker = None
-        self.route_line = None
-        self.route_points = []
+        self.mission = Mission()
+        self.waypoints = WaypointLayer(self.map_widget)
+        self.prefetch_thread = None
+        self.load_thread = None
+        self.track = FlightTrack()
+        self.track_line = TrackPolyline(self.map_widget, self.track.capacity)
+        self.follow_uav = tk.BooleanVar(value=True)
+        self.follower = MapFollower(self.map_widget)
+        # Dragging the map means the operator is planning: stop following until re-enabled
+        self.map_widget.canvas.bind("<B1-Motion>", self.pause_follow, add="+")
         self.notebook.add(map_tab, text="Mapa")
 
         # Vertical Gauges
@@ -129,6 +367,24 @@ class IntegratedUAVGUI:
                                         width=20)
         self.del_wp_button.grid(row=0,column=1,sticky='n',pady=125)
 
+        self.prefetch_button = ttk.Button(main_frame, text="Descarregar Mapa", command=self.prefetch_map_tiles,
+                                          width=20)
+        self.prefetch_button.grid(row=0,column=1,sticky='n',pady=175)
+        self.follow_toggle = ttk.Checkbutton(main_frame, text="Seguir UAV", variable=self.follow_uav,
+                                             command=self.toggle_follow)
+        self.follow_toggle.grid(row=0,column=1,sticky='n',pady=205)
+        self.replay_button = ttk.Button(main_frame, text="Reproduzir Voo", command=self.open_replay, width=20)
+        self.replay_button.grid(row=0,column=1,sticky='n',pady=230)
+        self.analysis_button = ttk.Button(main_frame, text="Analisar Voo", command=self.open_analysis, width=20)
+        self.analysis_button.grid(row=0,column=1,sticky='n',pady=255)
+        self.export_thread = None
+        self.export_button = ttk.Menubutton(main_frame, text="Exportar Voo", width=18)
+        export_menu = tk.Menu(self.export_button, tearoff=False)
+        for extension, fmt in EXPORT_FORMATS.items():
+            export_menu.add_command(label=fmt.upper(), command=lambda extension=extension: self.export_flights(extension))
+        self.export_button["menu"] = export_menu
+        self.export_button.grid(row=0,column=1,sticky='n',pady=280)
+
 
         self.alt_gauge = tk.Canvas(main_frame, width=50, height=220, bg='black')
         self.alt_gauge.grid(row=0, column=3, sticky='n', pady=1)
@@ -159,32 +415,78 @@ class IntegratedUAVGUI:
                                           command=self.toggle_mode)
         self.sim_toggle.grid(row=0, column=1, sticky='e')
 
-        self.running = True
-        self.reader_thread = threading.Thread(target=self.data_loop, daemon=True)
-        self.reader_thread.start()
-
-        self.update_compass()
-        self.update_gauges()
-        self.update_horizon()
+        # Serial reader, simulator and uploads are coroutines on one asyncio loop thread. Both telemetry
+        # sources run all the time; the feed only decides which one reaches the instruments.
+        self.io_core = IOCore().start()
+        self.feed = TelemetryFeed(self.io_core, self.handle_frames)
+        # Everything from the vehicle is recorded, whichever source is on display
+        self.recorder = None
+        self.recording = True
+        self.serial_link = self.feed.add("serial", SerialLink(serial_port, BAUD_RATE, self.io_core), tap=self.record)
+        self.flight_sim = FlightSimulator(SIM_ROUTE, vehicle='multirotor', seed=SIM_SEED)
+        self.simulator = self.feed.add("sim", SimulatedSource(self.io_core, self.simulate_step, 1.0 / SIM_RATE_HZ))
+        self.feed.select("serial")
+        self.serial_link.start()
+        self.simulator.start()
+        self.sim_control = ControlClient(self.io_core)
+        self.replay = None
+        self.replay_window = None
+        self.analysis = None
+        self.uploader = MissionUploader(self.serial_link, self.io_core)
+        # Mission edits are journaled in the background; edits never saved last session come back at start-up
+        self.journal = MissionJournal(on_recover=lambda waypoints: self.root.after(0, self.restore_mission, waypoints))
+        self.mission.journal = self.journal
+        self.io_core.spawn(self.journal.run())
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.alt_tape = TapeGauge(self.alt_gauge)
+        self.speed_tape = TapeGauge(self.speed_gauge)
+
+        self.telemetry.subscribe(self.schedule_render)
+        self.render_frame()
 
     def draw_heading_marks(self):
         self.canvas.create_oval(100, 100, 300, 300, outline='black', width=2)
+        for angle in range(0, 360, 5):
+            length = 12 if angle % 30 == 0 else 8 if angle % 10 == 0 else 4
+            self.canvas.create_line(*compass_point(angle, 100), *compass_point(angle, 100 - length), fill='black')
         for angle in range(0, 360, 30):
-            x = 200 + math.sin(math.radians(angle)) * 115
-            y = 200 - math.cos(math.radians(angle)) * 115
-            self.canvas.create_text(x, y, text=str(angle), font=("Arial", 10, "bold"))
-
-    def update_compass(self):
-        angle = math.radians(self.current_heading)
-        x = 200 + math.sin(angle) * 100
-        y = 200 - math.cos(angle) * 100
+            x, y = compass_point(angle, 115)
+            if angle in CARDINALS:
+                self.canvas.create_text(x, y, text=CARDINALS[angle], font=("Arial", 12, "bold"),
+                                        fill='red' if angle == 0 else 'black')
+            else:
+                self.canvas.create_text(x, y, text=str(angle), font=("Arial", 10, "bold"))
+        self.canvas.tag_raise(self.compass_needle)
+
+    def schedule_render(self, snapshot=None):
+        # New data from any thread: coalesce into one redraw per frame interval
+        if not self.render_pending:
+            self.render_pending = True
+            self.root.after(FRAME_INTERVAL_MS, self.render_frame)
+
+    def render_frame(self):
+        self.render_pending = False
+        snap = self.telemetry.snapshot
+        last = self.drawn
+        if last is not None and snap.seq == last.seq:
+            return
+        if last is None or snap.heading != last.heading:
+            self.update_compass(snap)
+        if last is None or (snap.roll, snap.pitch) != (last.roll, last.pitch):
+            self.update_horizon(snap)
+        if last is None or (snap.altitude, snap.speed, snap.battery) != (last.altitude, last.speed, last.battery):
+            self.update_gauges(snap)
+        self.drawn = snap
+
+    def update_compass(self, snap):
+        x, y = compass_point(snap.heading, 100)
         self.canvas.coords(self.compass_needle, 200, 200, x, y)
-        self.canvas.itemconfig(self.heading_text, text=f"Rumo: {self.current_heading:.1f}°")
-        self.root.after(100, self.update_compass)
+        self.canvas.itemconfig(self.heading_text, text=f"Rumo: {snap.heading:.1f}°")
 
-    def update_horizon(self):
-        roll = self.flight_data['roll']
-        pitch = self.flight_data['pitch']
+    def update_horizon(self, snap):
+        roll = snap.roll
+        pitch = snap.pitch
         center_x, center_y = 200, 150
         offset = pitch * 2
         angle_rad = math.radians(roll)
@@ -199,37 +501,19 @@ class IntegratedUAVGUI:
         self.horizon_canvas.coords(self.ground, 0, center_y + offset, 400, 300)
         self.horizon_canvas.itemconfig(self.pitch_text, text=f"Pitch: {pitch:.1f}°")
         self.horizon_canvas.itemconfig(self.roll_text, text=f"Roll: {roll:.1f}°")
-        for i, (line, label) in enumerate(self.pitch_marks):
-            y = center_y - (i - 4) * 15
-            self.horizon_canvas.coords(line, 180, y, 220, y)
-            self.horizon_canvas.coords(label, 170, y)
-        self.root.after(100, self.update_horizon)
 
     
-    def update_gauges(self):
-        alt = self.flight_data['altitude']
-        spd = self.flight_data['speed']
-        bat = self.flight_data['battery']
-        center_y = 110
+    def update_gauges(self, snap):
+        alt = snap.altitude
+        spd = snap.speed
+        bat = snap.battery
 
         # Altitude gauge
-        self.alt_gauge.delete("all")
-        for i in range(-5, 6):
-            value = alt + i * 10
-            y = center_y - i * 10
-            self.alt_gauge.create_line(0, y, 30, y, fill='white')
-            self.alt_gauge.create_text(35, y, text=f"{value:.0f}", fill='white', anchor="w")
-        self.alt_gauge.create_line(0, center_y, 50, center_y, fill='red', width=2)
+        self.alt_tape.set_value(alt)
         self.alt_label.config(text=f"ALT:{alt:.0f} m")
 
         # Speed gauge
-        self.speed_gauge.delete("all")
-        for i in range(-5, 6):
-            value = spd + i * 10
-            y = center_y - i * 10
-            self.speed_gauge.create_line(0, y, 30, y, fill='white')
-            self.speed_gauge.create_text(35, y, text=f"{value:.0f}", fill='white', anchor="w")
-        self.speed_gauge.create_line(0, center_y, 50, center_y, fill='red', width=2)
+        self.speed_tape.set_value(spd)
         self.speed_label.config(text=f"VEL:{spd:.0f} km/h")
 
         # Battery
@@ -239,8 +523,6 @@ class IntegratedUAVGUI:
         else:
             self.battery_alert.config(text="")
 
-        self.root.after(500, self.update_gauges)
-
 
     def update_status_labels(self, flightmode='STABILIZATION', rssi=90):
         self.flightmode_label.config(text=f"Modo: {flightmode}")
@@ -248,195 +530,379 @@ class IntegratedUAVGUI:
 
     
     def toggle_mode(self):
-        import os
+        if self.replay:
+            self.stop_replay()
+        if self.analysis:
+            self.close_analysis()
         print("Simulação ligada" if self.simulation_mode.get() else "Simulação desligada")
 
-        # Update sim_mode.flag file for serial simulator
-        if self.simulation_mode.get():
-            open("sim_mode.flag", "w").close()
-        else:
-            if os.path.exists("sim_mode.flag"):
-                os.remove("sim_mode.flag")
-
-        # Restart data loop
-        self.running = False
-        time.sleep(1)
-        self.running = True
-        self.reader_thread = threading.Thread(target=self.data_loop, daemon=True)
-        self.reader_thread.start()
-
-    def data_loop(self):
-        while self.running:
-            if self.simulation_mode.get():
-                self.simulate_step()
-            else:
-                self.read_serial_step()
-            time.sleep(1)
+        # The serial simulator stays quiet while the GUI simulates locally
+        self.sim_control.send("PAUSE" if self.simulation_mode.get() else "RESUME")
+        self.feed.select("sim" if self.simulation_mode.get() else "serial")
 
     def simulate_step(self):
-        gps_points = [
-            (40.971958, -8.646664),
-            (40.972388, -8.646764),
-            (40.972549, -8.647595),
-            (40.972021, -8.648246),
-            (40.971531, -8.647407),
-            (40.972080, -8.646701)
-        ]
-        index = random.randint(0, len(gps_points) - 1)
-        lat, lon = gps_points[index]
-        self.current_heading = random.uniform(0, 359)
-        self.flight_data['altitude'] = 50 + random.uniform(-10, 10)
-        self.flight_data['speed'] = 50 + random.uniform(-5, 5)
-        self.flight_data['battery'] = 15.0 + random.uniform(-2.0, 0.5)
-        self.flight_data['roll'] = random.uniform(-30, 30)
-        self.flight_data['pitch'] = random.uniform(-20, 20)
-        mode = random.choice(['MAN', 'LOI', 'NAV', 'RTH'])
-        rssi = random.randint(60, 100)
-        self.root.after(0, self.update_status_labels, mode, rssi)
-        self.root.after(0, self.update_map_position, lat, lon)
-
-    def read_serial_step(self):
+        sim = self.flight_sim
+        frame = sim.step(1.0 / SIM_RATE_HZ)
+        if sim.seq % SIM_RATE_HZ == 0:
+            # Link quality falls off with distance from home
+            rssi = max(20, 100 - round(distance_m(*sim.origin, frame[0], frame[1]) / 20))
+            self.root.after(0, self.update_status_labels, 'NAV', rssi)
+        return frame
+
+    def handle_frames(self, frames):
+        # Runs on the I/O loop thread with every batch from the selected source
+        for frame in frames:
+            snap = self.telemetry.publish(*frame)
+        self.root.after(0, self.update_map_position, snap.lat, snap.lon)
+
+    def record(self, frames):
+        # Runs inside the serial read loop: a recording problem must never stop live telemetry
+        if not self.recording:
+            return
+        if self.recorder is None:
+            path = os.path.join(RECORDINGS_DIR, time.strftime("voo_%Y%m%d_%H%M%S") + LOG_EXTENSION)
+            try:
+                os.makedirs(RECORDINGS_DIR, exist_ok=True)
+                self.recorder = FlightRecorder(path)
+            except (OSError, ValueError) as e:
+                print(f"Gravação do voo desativada: {e}")
+                self.recording = False
+                return
+            self.io_core.spawn(self.recorder.run())
+            print(f"A gravar o voo em {path}")
+        self.recorder.append_batch(frames)
+
+    def open_replay(self):
+        file_path = filedialog.askopenfilename(initialdir=RECORDINGS_DIR,
+                                               filetypes=[("Registos de voo", "*" + LOG_EXTENSION)])
+        if not file_path:
+            return
+        if self.replay:
+            self.stop_replay()
+        try:
+            replay = ReplaySource(self.io_core, file_path)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao abrir o registo: {e}")
+            return
+        self.replay = self.feed.add("replay", replay)
+        self.replay.start()
+        self.feed.select("replay")
+        self.track.clear()
+        self.track_line.clear()
+
+        log = replay.log
+        window = self.replay_window = tk.Toplevel(self.root)
+        window.title(f"Reprodução - {os.path.basename(file_path)}")
+        window.protocol("WM_DELETE_WINDOW", self.stop_replay)
+        self.replay_position = tk.DoubleVar(value=0.0)
+        ttk.Label(window, text="Posição (min)").grid(row=0, column=0, padx=5, pady=5)
+        position = ttk.Scale(window, from_=0.0, to=max((log.end - log.begin) / 60, 0.1), length=400,
+                             variable=self.replay_position)
+        position.grid(row=0, column=1, padx=5, pady=5)
+        position.bind("<ButtonRelease-1>", lambda event: self.replay.seek(self.replay_position.get() * 60))
+        self.replay_time_label = ttk.Label(window, text="0:00", width=8)
+        self.replay_time_label.grid(row=0, column=2, padx=5)
+        ttk.Label(window, text="Velocidade (x)").grid(row=1, column=0, padx=5, pady=5)
+        speed = tk.Spinbox(window, from_=1, to=MAX_REPLAY_SPEED, increment=1, width=6,
+                           command=lambda: self.replay.set_speed(float(speed.get())))
+        speed.grid(row=1, column=1, sticky='w', padx=5)
+        ttk.Button(window, text="Parar", command=self.stop_replay).grid(row=1, column=2, padx=5, pady=5)
+        self.update_replay_position()
+
+    def update_replay_position(self):
+        if not self.replay:
+            return
+        offset = self.replay.position - self.replay.log.begin
+        self.replay_position.set(offset / 60)
+        self.replay_time_label.config(text=f"{int(offset // 60)}:{int(offset % 60):02d}")
+        self.root.after(REPLAY_UI_MS, self.update_replay_position)
+
+    def stop_replay(self):
+        self.replay.stop()
+        self.feed.sources.pop("replay", None)
+        self.replay = None
+        self.feed.select("sim" if self.simulation_mode.get() else "serial")
+        if self.replay_window:
+            self.replay_window.destroy()
+            self.replay_window = None
+
+    def open_analysis(self):
+        # Post-flight mode: the slider drives the instruments straight from the memory-mapped log
+        try:
+            from UAV_LogView import LogView  # numpy is only needed for post-flight analysis
+        except ImportError as e:
+            print(f"Análise de voo indisponível: {e}")
+            return
+        file_path = filedialog.askopenfilename(initialdir=RECORDINGS_DIR,
+                                               filetypes=[("Registos de voo", "*" + LOG_EXTENSION)])
+        if not file_path:
+            return
         try:
-            with serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1) as ser:
-                line = ser.readline().decode('utf-8').strip()
-                if line:
-                    try:
-                        lat_str, lon_str, head_str, alt_str, spd_str, bat_str, roll_str, pitch_str = line.split(',')
-                        lat = float(lat_str.strip())
-                        lon = float(lon_str.strip())
-                        heading = float(head_str.strip())
-                        altitude = float(alt_str.strip())
-                        speed = float(spd_str.strip())
-                        battery = float(bat_str.strip())
-                        roll = float(roll_str.strip())
-                        pitch = float(pitch_str.strip())
-                        self.current_heading = heading
-                        self.flight_data['altitude'] = altitude
-                        self.flight_data['speed'] = speed
-                        self.flight_data['battery'] = battery
-                        self.flight_data['roll'] = roll
-                        self.flight_data['pitch'] = pitch
-                        self.root.after(0, self.update_map_position, lat, lon)
-                    except ValueError:
-                        print(f"Ignored invalid line: {line}")
-        except serial.SerialException as e:
-            print(f"[Serial error] {e}")
+            view = LogView(file_path)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao abrir o registo: {e}")
+            return
+        if not view.rows:
+            print(f"Registo vazio: {file_path}")
+            return
+        if self.replay:
+            self.stop_replay()
+        if self.analysis:
+            self.close_analysis()
+        # No source is named "analise", so live frames stop reaching the instruments until it closes
+        self.feed.select("analise")
+        self.analysis = view
+        overview = view.track()
+        self.analysis_paths = [self.draw_analysis_track(overview, "purple"), None]
+        bounds = mission_bounds(overview)
+        if bounds:
+            self.map_widget.fit_bounding_box(*bounds)
+
+        window = self.analysis_window = tk.Toplevel(self.root)
+        window.title(f"Análise - {os.path.basename(file_path)}")
+        window.protocol("WM_DELETE_WINDOW", self.close_analysis)
+        ttk.Label(window, text="Tempo").grid(row=0, column=0, padx=5, pady=5)
+        slider = ttk.Scale(window, from_=0.0, to=max(view.end - view.begin, 1.0), length=500,
+                           command=lambda value: self.show_analysis_time(float(value)))
+        slider.grid(row=0, column=1, padx=5, pady=5)
+        # The full-resolution stretch around the cursor is only redrawn once the slider is let go
+        slider.bind("<ButtonRelease-1>", lambda event: self.draw_analysis_detail(slider.get()))
+        self.analysis_time_label = ttk.Label(window, text="0:00", width=8)
+        self.analysis_time_label.grid(row=0, column=2, padx=5)
+        self.show_analysis_time(0.0)
+
+    def draw_analysis_track(self, points, color, width=2):
+        return self.map_widget.set_path(points, color=color, width=width) if len(points) > 1 else None
+
+    def show_analysis_time(self, offset):
+        snap = self.telemetry.publish(*self.analysis.frame_at(self.analysis.begin + offset))
+        if self.marker is None:
+            self.marker = self.map_widget.set_marker(snap.lat, snap.lon, text="UAV")
+        else:
+            self.marker.set_position(snap.lat, snap.lon)
+        self.analysis_time_label.config(text=f"{int(offset // 60)}:{int(offset % 60):02d}")
+
+    def draw_analysis_detail(self, offset):
+        if self.analysis_paths[1]:
+            self.analysis_paths[1].delete()
+        cursor = self.analysis.begin + offset
+        points = self.analysis.track(start=cursor - ANALYSIS_DETAIL_S, end=cursor + ANALYSIS_DETAIL_S)
+        self.analysis_paths[1] = self.draw_analysis_track(points, "orange", width=3)
+
+    def close_analysis(self):
+        for path in self.analysis_paths:
+            if path:
+                path.delete()
+        self.analysis.close()
+        self.analysis = None
+        self.analysis_window.destroy()
+        self.feed.select("sim" if self.simulation_mode.get() else "serial")
+
+    def on_close(self):
+        self.io_core.stop()
+        self.root.destroy()
 
     
     def add_current_waypoint(self):
         lat = self.marker.position[0] if self.marker else 41.002381
         lon = self.marker.position[1] if self.marker else -8.638930
-        marker = self.map_widget.set_marker(lat, lon, text=f"WP{len(self.route_points) + 1}")
-        self.route_points.append((lat, lon))
-        if self.route_line:
-            self.map_widget.delete(self.route_line)
-        if len(self.route_points) > 1:
-            self.route_line = self.map_widget.set_path(self.route_points)
+        self.mission.append(lat, lon)
+        self.waypoints.append(self.mission)
 
     def send_waypoints(self):
-        if not self.route_points:
+        if not self.mission:
             print("Nenhum waypoint definido.")
             return
-        try:
-            with serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1) as ser:
-                rth_point = self.route_points[0]
-                if self.route_points[-1] != rth_point:
-                    self.route_points.append(rth_point)
-                for idx, (lat, lon) in enumerate(self.route_points):
-                    msg = f"WP,{idx + 1},{lat:.6f},{lon:.6f}\n"
-                    ser.write(msg.encode())
-                    ser.flush()
-                    time.sleep(0.1)
-                print("Waypoints enviados.")
-        except Exception as e:
-            print(f"Erro ao enviar waypoints: {e}")
+        if self.uploader.busy:
+            print("Envio de waypoints já em curso.")
+            return
+        if self.mission.close_loop():
+            self.waypoints.append(self.mission)
+        self.wp_send_button.config(text=f"Enviando 0/{len(self.mission)}")
+        self.uploader.upload(self.mission.points(),
+                             progress=lambda acked, total: self.root.after(0, self.upload_progress, acked, total),
+                             done=lambda failed: self.root.after(0, self.upload_done, failed))
+
+    def upload_progress(self, acked, total):
+        self.wp_send_button.config(text=f"Enviando {acked}/{total}")
+
+    def upload_done(self, failed):
+        self.wp_send_button.config(text="Enviar Waypoints")
+        if failed:
+            print(f"Erro ao enviar waypoints: sem confirmação para WP {', '.join(str(i + 1) for i in failed)}")
+        else:
+            print("Waypoints enviados.")
 
     def save_waypoints(self):
-        if not self.route_points:
+        if not self.mission:
             print("Nenhum waypoint para salvar.")
             return
-        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
+        file_path = filedialog.asksaveasfilename(defaultextension=MISSION_EXTENSION,
+                                                 filetypes=[("Missões", "*" + MISSION_EXTENSION)])
         if file_path:
-            with open(file_path, "w") as f:
-                json.dump(self.route_points, f)
-            print(f"Waypoints salvos em {file_path}")
+            # Snapshot and 'saved' marker on the Tk thread, so edits made during the write are journaled
+            # after the marker; the file itself (temp file + rename) is written on a worker
+            waypoints = self.mission.waypoints()
+            self.journal.mark_saved(file_path)
+            threading.Thread(target=self.save_worker, args=(waypoints, file_path), daemon=True).start()
+
+    def save_worker(self, waypoints, file_path):
+        try:
+            save_mission(waypoints, file_path)
+        except OSError as e:
+            self.journal.mark_dirty()
+            print(f"Erro ao gravar waypoints: {e}")
+            return
+        print(f"Waypoints salvos em {file_path}")
 
     def load_waypoints(self):
-        file_path = filedialog.askopenfilename(filetypes=[("JSON Files", "*.json")])
+        if self.load_thread and self.load_thread.is_alive():
+            print("Já está a carregar uma missão.")
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("Missões", "*" + MISSION_EXTENSION + " *.json")])
         if file_path:
-            try:
-                with open(file_path, "r") as f:
-                    points = json.load(f)
-                self.route_points.clear()
-                self.map_widget.delete_all_marker()
-                for idx, (lat, lon) in enumerate(points):
-                    marker = self.map_widget.set_marker(lat, lon, text=f"WP{idx + 1}")
-                    self.route_points.append((lat, lon))
-                if len(self.route_points) > 1:
-                    self.route_line = self.map_widget.set_path(self.route_points)
-                print("Waypoints carregados.")
-            except Exception as e:
-                print(f"Erro ao carregar waypoints: {e}")
+            # Parsing and validation happen off the Tk thread; only the finished mission comes back to it
+            self.load_thread = threading.Thread(target=self.load_worker, args=(file_path,), daemon=True)
+            self.load_thread.start()
+
+    def load_worker(self, file_path):
+        try:
+            waypoints = load_mission(file_path)
+        except (OSError, MissionFileError) as e:
+            print(f"Erro ao carregar waypoints: {e}")
+            return
+        self.root.after(0, self.commit_mission, waypoints, file_path)
+
+    def commit_mission(self, waypoints, saved_path=None):
+        # saved_path: the file the waypoints came from, so the autosave journal knows they are not unsaved work
+        self.waypoints.clear()
+        self.mission.clear()
+        self.mission.extend(waypoints)
+        # Fit before the markers exist: set_zoom/set_position redraw every marker and path already on the map.
+        # fit_bounding_box() would only schedule _fit_bounding_box() 100 ms later, after load() drew them all
+        bounds = mission_bounds(self.mission, margin_m=50)
+        if bounds:
+            with deferred_z_order(self.map_widget):
+                self.map_widget._fit_bounding_box(*bounds)
+        self.waypoints.load(self.mission)
+        if saved_path:
+            self.journal.mark_saved(saved_path)
+        print(f"{len(self.mission)} waypoints carregados.")
+
+    def restore_mission(self, waypoints):
+        # The compacted journal already holds exactly these waypoints; don't journal them a second time
+        journal, self.mission.journal = self.mission.journal, None
+        try:
+            self.commit_mission(waypoints)
+        finally:
+            self.mission.journal = journal
+        print(f"Missão recuperada do autosave ({len(waypoints)} waypoints por gravar).")
 
     def edit_last_waypoint(self):
-        if not self.route_points:
+        if not self.mission:
             print("Nenhum waypoint para editar.")
             return
-        lat = self.marker.position[0] if self.marker else self.route_points[-1][0]
-        lon = self.marker.position[1] if self.marker else self.route_points[-1][1]
-        self.route_points[-1] = (lat, lon)
-        self.map_widget.delete_all_marker()
-        rth_point = self.route_points[0]
-        if self.route_points[-1] != rth_point:
-            self.route_points.append(rth_point)
-        for idx, (lat, lon) in enumerate(self.route_points):
-            self.map_widget.set_marker(lat, lon, text=f"WP{idx + 1}")
-        if self.route_line:
-            self.map_widget.delete(self.route_line)
-        if len(self.route_points) > 1:
-            self.route_line = self.map_widget.set_path(self.route_points)
+        lat = self.marker.position[0] if self.marker else self.mission[-1][0]
+        lon = self.marker.position[1] if self.marker else self.mission[-1][1]
+        self.mission.update(-1, lat, lon)
+        self.waypoints.move(self.mission, -1)
+        if self.mission.close_loop():
+            self.waypoints.append(self.mission)
         print("Último waypoint editado.")
 
     def delete_last_waypoint(self):
-        if self.route_points:
-            self.route_points.pop()
-            self.map_widget.delete_all_marker()
-            rth_point = self.route_points[0] if self.route_points else None
-            if self.route_points and self.route_points[-1] != rth_point:
-                self.route_points.append(rth_point)
-            for idx, (lat, lon) in enumerate(self.route_points):
-                self.map_widget.set_marker(lat, lon, text=f"WP{idx + 1}")
-            if self.route_line:
-                self.map_widget.delete(self.route_line)
-                if len(self.route_points) > 1:
-                    self.route_line = self.map_widget.set_path(self.route_points)
-                else:
-                    self.route_line = None
+        if self.mission:
+            wp_id = self.mission.pop()
+            self.waypoints.remove(self.mission, wp_id, len(self.mission))
+            if self.mission.close_loop():
+                self.waypoints.append(self.mission)
             print("Último waypoint removido.")
 
     def generate_rth_path(self):
-        if not self.route_points or not self.marker:
+        if not self.mission or not self.marker:
             return
-        home = self.route_points[0]
-        current = self.marker.position
-        self.route_points.append(home)
-        self.map_widget.set_path(self.route_points)
+        home = self.mission[0]
+        self.mission.append(*home)
+        self.waypoints.append(self.mission)
         print("RTH path gerado.")
 
+    def prefetch_map_tiles(self, zoom_range=PREFETCH_ZOOM):
+        if self.prefetch_thread and self.prefetch_thread.is_alive():
+            print("Download do mapa já em curso.")
+            return
+        bounds = mission_bounds(self.mission)
+        if bounds is None:
+            print("Nenhum waypoint definido para descarregar o mapa.")
+            return
+        self.prefetch_thread = threading.Thread(target=self.prefetch_worker, args=(bounds, zoom_range), daemon=True)
+        self.prefetch_thread.start()
+
+    def prefetch_worker(self, bounds, zoom_range):
+        def report(done, total, failed):
+            if done + failed == total or (done + failed) % 50 == 0:
+                print(f"[Mapa] {done + failed}/{total} tiles")
+
+        try:
+            downloaded, failed = prefetch_tiles(*bounds, *zoom_range, progress=report)
+            print(f"Mapa descarregado: {downloaded} tiles novos, {failed} falhas.")
+        except Exception as e:
+            print(f"Erro ao descarregar o mapa: {e}")
+
+    def export_flights(self, extension):
+        if self.export_thread and self.export_thread.is_alive():
+            print("Exportação já em curso.")
+            return
+        log_paths = filedialog.askopenfilenames(initialdir=RECORDINGS_DIR,
+                                                filetypes=[("Registos de voo", "*" + LOG_EXTENSION)])
+        if not log_paths:
+            return
+        output_path = filedialog.asksaveasfilename(defaultextension=extension,
+                                                   filetypes=[(extension[1:].upper(), "*" + extension)])
+        if not output_path:
+            return
+        self.export_thread = threading.Thread(target=self.export_worker,
+                                              args=(log_paths, output_path, EXPORT_FORMATS[extension]), daemon=True)
+        self.export_thread.start()
+
+    def export_worker(self, log_paths, output_path, fmt):
+        def report(rows, total):
+            if rows == total or rows % 100000 < 4096:
+                print(f"[Exportar] {rows}/{total} frames")
+
+        try:
+            rows = export_logs(log_paths, output_path, fmt, progress=report)
+            print(f"{rows} frames exportados para {output_path}.")
+        except (OSError, ValueError) as e:
+            print(f"Erro ao exportar: {e}")
+
+    def toggle_follow(self):
+        if self.follow_uav.get():
+            if self.marker:
+                self.follower.update(*self.marker.position)
+        else:
+            self.follower.stop()
+
+    def pause_follow(self, event=None):
+        if self.follow_uav.get():
+            self.follow_uav.set(False)
+            self.follower.stop()
+
     def update_map_position(self, lat, lon):
-        self.route_points.append((lat, lon))
         if self.marker is None:
             self.marker = self.map_widget.set_marker(lat, lon, text="UAV")
         else:
             self.marker.set_position(lat, lon)
-        self.map_widget.set_position(lat, lon)
-        if self.route_line:
-            self.map_widget.delete(self.route_line)
-        self.route_line = self.map_widget.set_path(self.route_points, color="blue", width=3)
+        if self.follow_uav.get():
+            self.follower.update(lat, lon)
+        if self.track.append(lat, lon):
+            self.track_line.add(lat, lon)
 
 
 # === Main ===
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estação Terrestre UAV")
+    parser.add_argument("--port", default=SERIAL_PORT, help="porta série da telemetria (ou PTY)")
+    args = parser.parse_args()
     root = tk.Tk()
-    app = IntegratedUAVGUI(root)
+    app = IntegratedUAVGUI(root, serial_port=args.port)
     root.mainloop()
@@ -4,10 +4,8 @@ import sys
 import math
 import random
 import json
-import serial
 import threading
 import time
-import os
 
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTabWidget,
@@ -16,7 +14,12 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtCore import Qt, QTimer, QRectF
 from PyQt6.QtGui import QPainter, QPen, QColor, QFont
 
-SERIAL_PORT = 'COM7'
+from UAV_Control import ControlClient
+from UAV_IOCore import IOCore
+from UAV_Telemetry import SerialLink
+from UAV_VirtualSerial import configured_port
+
+SERIAL_PORT = configured_port('serial_port', 'COM7')
 BAUD_RATE = 9600
 LOW_BATTERY_THRESHOLD = 15.0
 
@@ -130,21 +133,23 @@ class UAVGroundStation(QWidget):
         self.timer.timeout.connect(self.update_loop)
         self.timer.start(1000)
 
+        self.io_core = IOCore().start()
+        self.serial_link = SerialLink(SERIAL_PORT, BAUD_RATE, self.io_core)
+        self.serial_link.start()
+        self.sim_control = ControlClient(self.io_core)
+        self.serial_timer = QTimer()
+        self.serial_timer.timeout.connect(self.read_serial_step)
+        self.serial_timer.start(50)
+
     def toggle_mode(self):
         self.simulation_mode = self.sim_toggle.isChecked()
         print("Simulação ligada" if self.simulation_mode else "Simulação desligada")
-        if self.simulation_mode:
-            open("sim_mode.flag", "w").close()
-        else:
-            if os.path.exists("sim_mode.flag"):
-                os.remove("sim_mode.flag")
+        self.sim_control.send("PAUSE" if self.simulation_mode else "RESUME")
 
     def update_loop(self):
         if self.simulation_mode:
             self.simulate_step()
-        else:
-            self.read_serial_step()
-        self.update_gauges()
+            self.update_gauges()
 
     def update_gauges(self):
         self.alt_gauge.update_value(self.flight_data["altitude"])
@@ -163,22 +168,28 @@ class UAVGroundStation(QWidget):
         self.rssi_label.setText(f"RSSI: {random.randint(60, 100)}%")
 
     def read_serial_step(self):
-        try:
-            with serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1) as ser:
-                line = ser.readline().decode("utf-8").strip()
-                if line:
-                    lat, lon, head, alt, spd, bat, roll, pitch = map(float, line.split(","))
-                    self.flight_data['altitude'] = alt
-                    self.flight_data['speed'] = spd
-                    self.flight_data['battery'] = bat
-                    self.flightmode_label.setText("Modo: NAV")
-                    self.rssi_label.setText("RSSI: 90%")
-        except:
-            pass
+        # Drained in simulation mode too, so the queue doesn't fill up and hand over stale frames later
+        frames = self.serial_link.get_frames(timeout=0)
+        if self.simulation_mode or not frames:
+            return
+        lat, lon, head, alt, spd, bat, roll, pitch = frames[-1]
+        self.flight_data['altitude'] = alt
+        self.flight_data['speed'] = spd
+        self.flight_data['battery'] = bat
+        self.flightmode_label.setText("Modo: NAV")
+        self.rssi_label.setText("RSSI: 90%")
+        self.update_gauges()
 
     def handle_button(self, label):
         print(f"Botão '{label}' clicado (função ainda não implementada)")
 
+    def closeEvent(self, event):
+        # Releases the serial port and stops the IOCore loop before the window goes away
+        self.serial_timer.stop()
+        self.serial_link.stop()
+        self.io_core.stop()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = UAVGroundStation()
@@ -5,23 +5,31 @@ import sys
 import math
 import random
 import json
-import serial
 import threading
 import time
-import os
 
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTabWidget,
     QPushButton, QCheckBox, QFileDialog, QFrame, QGraphicsView, QGraphicsScene
 )
-from PyQt6.QtCore import Qt, QTimer
-from PyQt6.QtGui import QPen, QColor
+from PyQt6.QtCore import Qt, QTimer, QPointF
+from PyQt6.QtGui import QPen, QColor, QPainter, QPixmap, QFont
 
+from UAV_Control import ControlClient
+from UAV_IOCore import IOCore
+from UAV_Telemetry import SerialLink
+from UAV_VirtualSerial import configured_port
 
 
-SERIAL_PORT = 'COM7'
+
+SERIAL_PORT = configured_port('serial_port', 'COM7')
 BAUD_RATE = 9600
 LOW_BATTERY_THRESHOLD = 15.0
+COMPASS_ANIMATION_MS = 16
+
+# sin/cos for every 5 degrees of the compass rose, computed once
+ROSE_TABLE = {angle: (math.sin(math.radians(angle)), math.cos(math.radians(angle))) for angle in range(0, 360, 5)}
+CARDINALS = {0: "N", 90: "E", 180: "S", 270: "W"}
 
 class VerticalGauge(QGraphicsView):
     def __init__(self, label_text, unit, color):
@@ -29,27 +37,46 @@ class VerticalGauge(QGraphicsView):
         self.label_text = label_text
         self.unit = unit
         self.color = color
-        self.value = 0
+        self.value = None
 
         self.setFixedSize(80, 160)
         self.scene = QGraphicsScene()
+        self.scene.setSceneRect(0, 0, 78, 158)
         self.setScene(self.scene)
 
+        # Tape items are created once; updates move the tick group and relabel only on a new decade
+        center_y = 110
+        self.offsets = range(-6, 7)
+        self.tick_labels = []
+        items = []
+        for i in self.offsets:
+            y = center_y - i * 10
+            items.append(self.scene.addLine(0, y, 30, y, QPen(Qt.GlobalColor.white)))
+            label = self.scene.addText("")
+            label.setPos(35, y - 8)
+            self.tick_labels.append(label)
+            items.append(label)
+        self.tape = self.scene.createItemGroup(items)
+        self.scene.addLine(0, center_y, 60, center_y, QPen(Qt.GlobalColor.red, 2))
+        self.value_text = self.scene.addText("")
+        self.value_text.setPos(5, 140)
+        self.base = None
+        self.update_value(0)
 
     def update_value(self, val):
+        if val == self.value:
+            return
         self.value = val
         self.draw_gauge()
 
     def draw_gauge(self):
-        self.scene.clear()
-        center_y = 110
-        for i in range(-5, 6):
-            val = self.value + i * 10
-            y = center_y - i * 10
-            self.scene.addLine(0, y, 30, y, QPen(Qt.GlobalColor.white))
-            self.scene.addText(f"{val:.0f}").setPos(35, y - 8)
-        self.scene.addLine(0, center_y, 60, center_y, QPen(Qt.GlobalColor.red, 2))
-        self.scene.addText(f"{self.label_text}: {self.value:.0f} {self.unit}").setPos(5, 140)
+        base = math.floor(self.value / 10) * 10
+        if base != self.base:
+            for i, label in zip(self.offsets, self.tick_labels):
+                label.setPlainText(f"{base + i * 10:.0f}")
+            self.base = base
+        self.tape.setPos(0, self.value - base)
+        self.value_text.setPlainText(f"{self.label_text}: {self.value:.0f} {self.unit}")
 
 
 class CompassWidget(QGraphicsView):
@@ -57,48 +84,101 @@ class CompassWidget(QGraphicsView):
         super().__init__()
         self.setFixedSize(300, 300)
         self.scene = QGraphicsScene()
+        self.scene.setSceneRect(0, 0, 300, 300)
         self.setScene(self.scene)
-        self.heading = 0
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.heading = 0.0
+        self.target_heading = 0.0
+
+        # The rose is painted once into a pixmap; only the needle is rotated per frame
+        self.center = 150
+        self.radius = 100
+        self.scene.addPixmap(self.render_rose())
+        self.needle = self.scene.addLine(self.center, self.center, self.center, self.center - (self.radius - 10),
+                                         QPen(Qt.GlobalColor.red, 3))
+        self.needle.setTransformOriginPoint(self.center, self.center)
+
+        self.animation = QTimer()
+        self.animation.timeout.connect(self.draw_compass)
+
+    def render_rose(self):
+        center, radius = self.center, self.radius
+        pixmap = QPixmap(300, 300)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(QPen(Qt.GlobalColor.black))
+        painter.drawEllipse(QPointF(center, center), radius, radius)
+        for angle, (sin_a, cos_a) in ROSE_TABLE.items():
+            length = 12 if angle % 30 == 0 else 8 if angle % 10 == 0 else 4
+            painter.drawLine(QPointF(center + sin_a * radius, center - cos_a * radius),
+                             QPointF(center + sin_a * (radius - length), center - cos_a * (radius - length)))
+        for angle in range(0, 360, 30):
+            sin_a, cos_a = ROSE_TABLE[angle]
+            x = center + sin_a * (radius + 18)
+            y = center - cos_a * (radius + 18)
+            if angle in CARDINALS:
+                painter.setFont(QFont("Arial", 12, QFont.Weight.Bold))
+                painter.setPen(QPen(Qt.GlobalColor.red if angle == 0 else Qt.GlobalColor.black))
+                text = CARDINALS[angle]
+            else:
+                painter.setFont(QFont("Arial", 9))
+                painter.setPen(QPen(Qt.GlobalColor.black))
+                text = str(angle)
+            painter.drawText(int(x) - 15, int(y) - 10, 30, 20, Qt.AlignmentFlag.AlignCenter, text)
+        painter.end()
+        return pixmap
 
     def update_heading(self, heading):
-        self.heading = heading
-        self.draw_compass()
+        self.target_heading = heading % 360
+        if not self.animation.isActive():
+            self.animation.start(COMPASS_ANIMATION_MS)
 
     def draw_compass(self):
-        self.scene.clear()
-        center = 150
-        radius = 100
-        self.scene.addEllipse(center - radius, center - radius, 2*radius, 2*radius, QPen(Qt.GlobalColor.black))
-        for angle in range(0, 360, 30):
-            rad = math.radians(angle)
-            x = center + math.sin(rad) * radius
-            y = center - math.cos(rad) * radius
-            text = self.scene.addText(str(angle))
-            text.setPos(x - 10, y - 10)
-        needle_angle = math.radians(self.heading)
-        x = center + math.sin(needle_angle) * (radius - 10)
-        y = center - math.cos(needle_angle) * (radius - 10)
-        self.scene.addLine(center, center, x, y, QPen(Qt.GlobalColor.red, 3))
+        # Ease towards the target along the shortest arc, one step per animation tick
+        delta = (self.target_heading - self.heading + 180) % 360 - 180
+        if abs(delta) < 0.1:
+            self.heading = self.target_heading
+            self.animation.stop()
+        else:
+            self.heading = (self.heading + delta * 0.3) % 360
+        self.needle.setRotation(self.heading)
 
 class HorizonWidget(QGraphicsView):
     def __init__(self):
         super().__init__()
         self.setFixedSize(400, 300)
         self.scene = QGraphicsScene()
+        self.scene.setSceneRect(0, 0, 400, 300)
         self.setScene(self.scene)
-        self.draw_horizon()
-        self.roll = 0
-        self.pitch = 0
+        self.roll = None
+        self.pitch = None
+
+        center_y = 150
+        self.sky = self.scene.addRect(0, 0, 400, center_y, QPen(), QColor("skyblue"))
+        self.ground = self.scene.addRect(0, center_y, 400, 300 - center_y, QPen(), QColor("saddlebrown"))
+        self.horizon_line = self.scene.addLine(0, center_y, 400, center_y, QPen(Qt.GlobalColor.yellow, 3))
+        for i in range(-4, 5):
+            y = center_y - (i * 15)
+            self.scene.addLine(180, y, 220, y, QPen(Qt.GlobalColor.black))
+            self.scene.addText(f"{i*5:+}").setPos(160, y - 8)
+        self.roll_text = self.scene.addText("")
+        self.roll_text.setPos(10, 10)
+        self.pitch_text = self.scene.addText("")
+        self.pitch_text.setPos(10, 270)
+        self.update_attitude(0, 0)
 
     def update_attitude(self, roll, pitch):
+        if (roll, pitch) == (self.roll, self.pitch):
+            return
         self.roll = roll
         self.pitch = pitch
         self.draw_horizon()
 
     def draw_horizon(self):
-        self.pitch = 0
-        self.roll = 0
-        self.scene.clear()
+        # Moves the retained items to self.roll/self.pitch as set by update_attitude(); the widget starts
+        # level through update_attitude(0, 0) in __init__, so nothing here resets the attitude
         center_x, center_y = 200, 150
         offset = self.pitch * 2
         angle_rad = math.radians(self.roll)
@@ -108,15 +188,11 @@ class HorizonWidget(QGraphicsView):
         y1 = center_y - dy + offset
         x2 = center_x + dx
         y2 = center_y + dy + offset
-        self.scene.addRect(0, 0, 400, center_y + offset, QPen(), QColor("skyblue"))
-        self.scene.addRect(0, center_y + offset, 400, 300 - (center_y + offset), QPen(), QColor("saddlebrown"))
-        self.scene.addLine(x1, y1, x2, y2, QPen(Qt.GlobalColor.yellow, 3))
-        for i in range(-4, 5):
-            y = center_y - (i * 15)
-            self.scene.addLine(180, y, 220, y, QPen(Qt.GlobalColor.black))
-            self.scene.addText(f"{i*5:+}").setPos(160, y - 8)
-        self.scene.addText(f"Roll: {self.roll:.1f}").setPos(10, 10)
-        self.scene.addText(f"Pitch: {self.pitch:.1f}").setPos(10, 270)
+        self.sky.setRect(0, 0, 400, center_y + offset)
+        self.ground.setRect(0, center_y + offset, 400, 300 - (center_y + offset))
+        self.horizon_line.setLine(x1, y1, x2, y2)
+        self.roll_text.setPlainText(f"Roll: {self.roll:.1f}")
+        self.pitch_text.setPlainText(f"Pitch: {self.pitch:.1f}")
 
 class UAVGroundStation(QWidget):
     def __init__(self):
@@ -203,21 +279,23 @@ class UAVGroundStation(QWidget):
         self.timer.timeout.connect(self.update_loop)
         self.timer.start(1000)
 
+        self.io_core = IOCore().start()
+        self.serial_link = SerialLink(SERIAL_PORT, BAUD_RATE, self.io_core)
+        self.serial_link.start()
+        self.sim_control = ControlClient(self.io_core)
+        self.serial_timer = QTimer()
+        self.serial_timer.timeout.connect(self.read_serial_step)
+        self.serial_timer.start(50)
+
     def toggle_mode(self):
         self.simulation_mode = self.sim_toggle.isChecked()
         print("Simulação ligada" if self.simulation_mode else "Simulação desligada")
-        if self.simulation_mode:
-            open("sim_mode.flag", "w").close()
-        else:
-            if os.path.exists("sim_mode.flag"):
-                os.remove("sim_mode.flag")
+        self.sim_control.send("PAUSE" if self.simulation_mode else "RESUME")
 
     def update_loop(self):
         if self.simulation_mode:
             self.simulate_step()
-        else:
-            self.read_serial_step()
-        self.update_gauges()
+            self.update_gauges()
 
     def update_gauges(self):
         self.alt_gauge.update_value(self.flight_data["altitude"])
@@ -238,22 +316,30 @@ class UAVGroundStation(QWidget):
         self.compass.update_heading(random.uniform(0, 360))
 
     def read_serial_step(self):
-        try:
-            with serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1) as ser:
-                line = ser.readline().decode("utf-8").strip()
-                if line:
-                    lat, lon, head, alt, spd, bat, roll, pitch = map(float, line.split(","))
-                    self.flight_data['altitude'] = alt
-                    self.flight_data['speed'] = spd
-                    self.flight_data['battery'] = bat
-                    self.flightmode_label.setText("Modo: NAV")
-                    self.rssi_label.setText("RSSI: 90%")
-        except:
-            pass
+        # Drained in simulation mode too, so the queue doesn't fill up and hand over stale frames later
+        frames = self.serial_link.get_frames(timeout=0)
+        if self.simulation_mode or not frames:
+            return
+        lat, lon, head, alt, spd, bat, roll, pitch = frames[-1]
+        self.flight_data['altitude'] = alt
+        self.flight_data['speed'] = spd
+        self.flight_data['battery'] = bat
+        self.flightmode_label.setText("Modo: NAV")
+        self.rssi_label.setText("RSSI: 90%")
+        self.horizon.update_attitude(roll, pitch)
+        self.compass.update_heading(head)
+        self.update_gauges()
 
     def handle_button(self, label):
         print(f"Botão '{label}' clicado (função ainda não implementada)")
 
+    def closeEvent(self, event):
+        # Releases the serial port and stops the IOCore loop before the window goes away
+        self.serial_timer.stop()
+        self.serial_link.stop()
+        self.io_core.stop()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = UAVGroundStation()
@@ -1,12 +1,24 @@
 
-import time
+import argparse
+import os
 import random
 import serial
-import os
+import threading
+import time
+from UAV_Control import ControlServer
+from UAV_FlightSim import MAX_RATE_HZ, FlightSimulator, encode_frame
+from UAV_VirtualSerial import PORTS_CONFIG, VirtualSerialPair, configured_port, write_ports_config
 
-# Adjust to your virtual COM port
-SIM_PORT = 'COM5'
+# Adjust to your virtual COM port (or UAV_SIM_PORT / uav_ports.json / --port / --pty)
+SIM_PORT = configured_port('sim_port', 'COM5')
 BAUD_RATE = 9600
+# Send packed binary frames (26 bytes) instead of CSV lines; the GUI detects either format
+BINARY_FRAMES = False
+# Fraction of uploaded waypoints answered with NAK, to exercise the GUI's retries
+WAYPOINT_NAK_RATE = 0.0
+# Same seed and rate -> same flight, frame for frame
+SIM_SEED = 0
+SIM_VEHICLE = 'fixed_wing'
 
 gps_points = [
     (41.002381, -8.638930),
@@ -17,30 +29,121 @@ gps_points = [
     (41.002130, -8.638588)
 ]
 
-def is_simulation_mode_enabled():
-    return os.path.exists("sim_mode.flag")
+# Scenario presets selectable over the control channel ("SCENARIO bateria_fraca"); applied to the simulator
+SCENARIOS = {
+    'normal': {'wind_speed': 0.0, 'turbulence_deg': 1.0},
+    'bateria_fraca': {'state_of_charge': 0.2},
+    'vento_forte': {'wind_speed': 10.0, 'turbulence_deg': 5.0},
+}
 
 flight_modes = ['MANUAL', 'STABILIZATION', 'LOITER', 'NAVIGATION', 'RTH']
 
+write_lock = threading.Lock()
+mission = {}
+sim_state = {'paused': False, 'rate_hz': 1.0, 'scenario': 'normal'}
+wakeup = threading.Event()
+
+
+def send(ser, data):
+    with write_lock:
+        ser.write(data)
+        ser.flush()
+
+
+def waypoint_responder(ser):
+    # Answers every "WP,n,lat,lon" line from the GUI with "ACK,n", or "NAK,n" when it can't be parsed
+    while True:
+        line = ser.readline().decode('utf-8', errors='replace').strip()
+        if not line.startswith("WP,"):
+            continue
+        fields = line.split(',')
+        try:
+            index = int(fields[1])
+        except (IndexError, ValueError):
+            print(f"Waypoint inválido: {line}")
+            continue
+        try:
+            if len(fields) != 4 or random.random() < WAYPOINT_NAK_RATE:
+                raise ValueError(line)
+            mission[index] = (float(fields[2]), float(fields[3]))
+            send(ser, f"ACK,{index}\n".encode())
+            print(f"WP{index} recebido: {mission[index][0]:.6f}, {mission[index][1]:.6f}")
+        except ValueError:
+            send(ser, f"NAK,{index}\n".encode())
+
+
+def handle_control(command, args):
+    # Commands from the GUI's control channel; wakes the send loop so they apply at once
+    if command == 'PAUSE':
+        sim_state['paused'] = True
+    elif command == 'RESUME':
+        sim_state['paused'] = False
+    elif command == 'RATE':
+        try:
+            rate_hz = float(args[0])
+        except (IndexError, ValueError):
+            raise ValueError("uso: RATE <Hz>")
+        if not 0 < rate_hz <= MAX_RATE_HZ:
+            raise ValueError(f"taxa fora de 0-{MAX_RATE_HZ:.0f} Hz")
+        sim_state['rate_hz'] = rate_hz
+    elif command == 'SCENARIO':
+        if not args or args[0] not in SCENARIOS:
+            raise ValueError(f"cenários: {', '.join(SCENARIOS)}")
+        sim_state['scenario'] = args[0]
+    wakeup.set()
+    return ' '.join(f"{key}={value}" for key, value in sim_state.items())
+
+
+parser = argparse.ArgumentParser(description="Simulador serial de telemetria UAV")
+parser.add_argument("--port", default=SIM_PORT, help="porta série onde escrever a telemetria")
+parser.add_argument("--pty", action="store_true",
+                    help=f"cria um par série virtual (Linux) e grava os caminhos em {PORTS_CONFIG} para a GUI")
+args = parser.parse_args()
+
+pair = None
+if args.pty:
+    pair = VirtualSerialPair().open()
+    write_ports_config(pair.port_a, pair.port_b)
+    args.port = pair.port_b
+    print(f"Par série virtual: GUI em {pair.port_a}, simulador em {pair.port_b}")
+
 try:
-    ser = serial.Serial(SIM_PORT, BAUD_RATE)
-    print(f"Simulador serial ativo em {SIM_PORT} a {BAUD_RATE} baud.")
-    index = 0
+    ser = serial.Serial(args.port, BAUD_RATE)
+    print(f"Simulador serial ativo em {args.port} a {BAUD_RATE} baud.")
+    threading.Thread(target=waypoint_responder, args=(ser,), daemon=True).start()
+    control = ControlServer(handle_control).start()
+    print(f"Canal de controlo em {control.server_address[0]}:{control.server_address[1]}")
+    sim = FlightSimulator(gps_points, vehicle=SIM_VEHICLE, seed=SIM_SEED)
+    applied_scenario = None
+    next_tick = time.monotonic()
 
     while True:
-        if not is_simulation_mode_enabled():
-            lat, lon = gps_points[index % len(gps_points)]
-            heading = random.uniform(0, 360)
-            altitude = 100 + random.uniform(-5, 5)
-            speed = 70 + random.uniform(-3, 3)
-            battery = 15.8 + random.uniform(-2.0, 0.5)
-            roll = random.uniform(-25, 25)
-            pitch = random.uniform(-15, 15)
-
-            data_string = f"{lat:.6f},{lon:.6f},{heading:.1f},{altitude:.1f},{speed:.1f},{battery:.2f},{roll:.1f},{pitch:.1f}\n"
-            ser.write(data_string.encode())
-            ser.flush()
-            index += 1
-        time.sleep(1.0)
+        if sim_state['paused']:
+            wakeup.wait()
+            wakeup.clear()
+            next_tick = time.monotonic()
+            continue
+        if sim_state['scenario'] != applied_scenario:
+            applied_scenario = sim_state['scenario']
+            for name, value in SCENARIOS[applied_scenario].items():
+                setattr(sim, name, value)
+
+        # Simulated time advances by exactly one period per frame, whatever the wall clock does
+        period = 1.0 / sim_state['rate_hz']
+        send(ser, encode_frame(sim.seq, sim.step(period), BINARY_FRAMES))
+
+        next_tick += period
+        delay = next_tick - time.monotonic()
+        if delay < -1.0:
+            next_tick = time.monotonic()
+        if wakeup.wait(max(0.0, delay)):
+            wakeup.clear()
+            next_tick = time.monotonic()
+except KeyboardInterrupt:
+    print("Simulador terminado.")
 except Exception as e:
     print(f"Erro ao iniciar simulador: {e}")
+finally:
+    if pair is not None:
+        pair.close()
+        os.remove(PORTS_CONFIG)
@@ -0,0 +1,90 @@
+# Local control channel between the ground station GUIs and the serial simulator
+# === Imports ===
+import asyncio
+import socketserver
+import threading
+
+# === Constants ===
+# Plain TCP on loopback so it works the same on Windows (COM ports) and Linux
+CONTROL_HOST = '127.0.0.1'
+CONTROL_PORT = 47600
+CONNECT_TIMEOUT = 1.0
+REPLY_TIMEOUT = 2.0
+COMMANDS = ('PAUSE', 'RESUME', 'RATE', 'SCENARIO', 'STATUS')
+
+
+def parse_command(line):
+    # "RATE 5" -> ('RATE', ['5']) (ValueError for unknown commands)
+    words = line.strip().split()
+    if not words or words[0].upper() not in COMMANDS:
+        raise ValueError(f"comando desconhecido: {line.strip()!r}")
+    return words[0].upper(), words[1:]
+
+
+# === Simulator Side ===
+class ControlServer(socketserver.ThreadingTCPServer):
+    """Line-based command server. `handler(command, args)` returns the reply text or raises ValueError."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handler, host=CONTROL_HOST, port=CONTROL_PORT):
+        super().__init__((host, port), _ControlRequestHandler)
+        self.handler = handler
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _ControlRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in self.rfile:
+            try:
+                command, args = parse_command(raw.decode('utf-8', errors='replace'))
+                reply = f"OK {self.server.handler(command, args)}".rstrip()
+            except ValueError as e:
+                reply = f"ERR {e}"
+            self.wfile.write(reply.encode() + b'\n')
+
+
+# === GUI Side ===
+class ControlClient:
+    """Sends commands to the simulator from the IOCore loop, connecting on demand."""
+
+    def __init__(self, core, host=CONTROL_HOST, port=CONTROL_PORT):
+        self.core = core
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    def send(self, *command):
+        # Any thread; returns a future with the reply line (None if the simulator isn't listening)
+        return self.core.spawn(self.request(*command))
+
+    async def request(self, *command):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        line = ' '.join(str(word) for word in command)
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), CONNECT_TIMEOUT)
+                self._writer.write(line.encode() + b'\n')
+                await self._writer.drain()
+                reply = await asyncio.wait_for(self._reader.readline(), REPLY_TIMEOUT)
+                if not reply:
+                    raise ConnectionResetError("ligação fechada pelo simulador")
+                return reply.decode().strip()
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"[Controlo] Simulador indisponível ({line}): {e or 'sem resposta'}")
+                self._close()
+                return None
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
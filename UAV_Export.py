@@ -0,0 +1,227 @@
+# Streaming export of .uavlog flight recordings to CSV, Parquet, KML and GPX
+# === Imports ===
+import argparse
+import csv
+import os
+import time
+from array import array
+from itertools import repeat
+from xml.sax.saxutils import escape
+
+from UAV_FlightLog import LOG_COLUMNS, FlightLog
+
+# === Constants ===
+EXPORT_FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.kml': 'kml', '.gpx': 'gpx'}
+EXPORT_BATCH_CHUNKS = 16      # log chunks (256 rows each) converted per write; bounds memory per flight
+EXPORT_COLUMNS = ('flight',) + tuple(name for name, _ in LOG_COLUMNS)
+LOG_INDEX = {name: index for index, (name, _) in enumerate(LOG_COLUMNS)}
+FLOAT32_INDEXES = tuple(index for index, (_, code) in enumerate(LOG_COLUMNS) if code == 'f')
+
+
+def export_format(path):
+    # Format from the output extension (ValueError when unknown)
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXPORT_FORMATS:
+        raise ValueError(f"formato desconhecido: {extension or path} (use {', '.join(EXPORT_FORMATS)})")
+    return EXPORT_FORMATS[extension]
+
+
+def _utc(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)) + f".{int(timestamp % 1 * 1000):03d}Z"
+
+
+def float32_text(column):
+    # Shortest of 7-9 significant digits that reads back as the same float32. repr() would print the value
+    # widened to double (123.4 -> 123.4000015258789); telemetry values almost always fit in 7 digits
+    text = ['%.7g' % value for value in column]
+    for index, (parsed, value) in enumerate(zip(array('f', map(float, text)), column)):
+        if parsed != value:
+            longer = '%.8g' % value
+            text[index] = longer if array('f', [float(longer)])[0] == value else '%.9g' % value
+    return text
+
+
+def iter_log_batches(log, batch_chunks=EXPORT_BATCH_CHUNKS):
+    # Yields lists of column arrays (time first) covering up to batch_chunks chunks; corrupted chunks are skipped
+    batch = None
+    for index in range(log.chunks):
+        columns = log.read_chunk(index)
+        if columns is None:
+            print(f"[Exportar] Bloco {index} corrompido em {log.path}, ignorado")
+            continue
+        if batch is None:
+            batch, pending = columns, 1
+        else:
+            for target, column in zip(batch, columns):
+                target.extend(column)
+            pending += 1
+        if pending == batch_chunks:
+            yield batch
+            batch = None
+    if batch is not None:
+        yield batch
+
+
+# === Writers ===
+# Each writer gets begin(flight) / write(flight, columns) / end(flight) per recording, then close()
+class CsvExport:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def begin(self, flight):
+        pass
+
+    def write(self, flight, columns):
+        # Doubles (time, lat, lon) go out through repr(), already the shortest exact form
+        columns = list(columns)
+        for index in FLOAT32_INDEXES:
+            columns[index] = float32_text(columns[index])
+        self.writer.writerows(zip(repeat(flight), *columns))
+
+    def end(self, flight):
+        pass
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetExport:
+    """One row group per batch through pyarrow's ParquetWriter. pyarrow is optional and only imported here."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("exportar para Parquet requer o pyarrow (pip install pyarrow)")
+        self.pa = pa
+        types = {'d': pa.float64(), 'f': pa.float32()}
+        self.schema = pa.schema([('flight', pa.string())] + [(name, types[code]) for name, code in LOG_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def begin(self, flight):
+        pass
+
+    def write(self, flight, columns):
+        pa = self.pa
+        rows = len(columns[0])
+        # Column arrays go to Arrow through the buffer protocol, without building Python floats
+        arrays = [pa.array([flight] * rows, pa.string())]
+        arrays += [pa.Array.from_buffers(field.type, rows, [None, pa.py_buffer(column)])
+                   for field, column in zip(list(self.schema)[1:], columns)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def end(self, flight):
+        pass
+
+    def close(self):
+        self.writer.close()
+
+
+class KmlExport:
+    # One Placemark per flight with an absolute-altitude LineString
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+                        '<Document>\n')
+
+    def begin(self, flight):
+        self.file.write(f'<Placemark><name>{escape(flight)}</name><LineString><altitudeMode>absolute'
+                        '</altitudeMode><coordinates>\n')
+
+    def write(self, flight, columns):
+        lat, lon, altitude = (columns[LOG_INDEX[name]] for name in ('lat', 'lon', 'altitude'))
+        self.file.writelines(f"{x:.7f},{y:.7f},{z:.1f}\n" for x, y, z in zip(lon, lat, altitude))
+
+    def end(self, flight):
+        self.file.write('</coordinates></LineString></Placemark>\n')
+
+    def close(self):
+        self.file.write('</Document>\n</kml>\n')
+        self.file.close()
+
+
+class GpxExport:
+    # One <trk> per flight; GPX 1.1 has no standard fields for speed or attitude, so only position and time
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<gpx version="1.1" creator="Estação Terrestre UAV" xmlns="http://www.topografix.com/GPX/1/1">\n')
+
+    def begin(self, flight):
+        self.file.write(f'<trk><name>{escape(flight)}</name><trkseg>\n')
+
+    def write(self, flight, columns):
+        timestamp, lat, lon, altitude = (columns[LOG_INDEX[name]] for name in ('time', 'lat', 'lon', 'altitude'))
+        self.file.writelines(f'<trkpt lat="{y:.7f}" lon="{x:.7f}"><ele>{z:.1f}</ele><time>{_utc(t)}</time></trkpt>\n'
+                             for t, y, x, z in zip(timestamp, lat, lon, altitude))
+
+    def end(self, flight):
+        self.file.write('</trkseg></trk>\n')
+
+    def close(self):
+        self.file.write('</gpx>\n')
+        self.file.close()
+
+
+WRITERS = {'csv': CsvExport, 'parquet': ParquetExport, 'kml': KmlExport, 'gpx': GpxExport}
+
+
+def export_logs(log_paths, output_path, fmt=None, progress=None, stop_event=None):
+    """Converts one or more .uavlog files into a single output file -> rows written.
+
+    Only one batch of EXPORT_BATCH_CHUNKS chunks is in memory at a time. Each input is one flight, named
+    after its file. progress(rows, total_rows) is called after every batch, from the calling thread.
+    """
+    writer = WRITERS[fmt or export_format(output_path)](output_path)
+    logs = []
+    try:
+        # One at a time, so the finally closes those already open if a later one fails
+        for path in log_paths:
+            logs.append(FlightLog(path))
+        total = sum(log.rows for log in logs)
+        written = 0
+        for log in logs:
+            flight = os.path.splitext(os.path.basename(log.path))[0]
+            writer.begin(flight)
+            for columns in iter_log_batches(log):
+                if stop_event is not None and stop_event.is_set():
+                    # Still close the open track so a cancelled KML/GPX is well-formed up to here
+                    writer.end(flight)
+                    return written
+                writer.write(flight, columns)
+                written += len(columns[0])
+                if progress:
+                    progress(written, total)
+            writer.end(flight)
+        return written
+    finally:
+        writer.close()
+        for log in logs:
+            log.close()
+
+
+# === Main ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta registos de voo (.uavlog) para CSV, Parquet, KML ou GPX")
+    parser.add_argument("logs", nargs='+', help="um ou mais ficheiros .uavlog (um voo cada)")
+    parser.add_argument("-o", "--output", required=True, help="ficheiro de saída; o formato vem da extensão")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="força o formato em vez da extensão")
+    args = parser.parse_args()
+    if not args.format:
+        try:
+            export_format(args.output)
+        except ValueError as e:
+            parser.error(str(e))
+
+    def report(rows, total):
+        print(f"\r{rows}/{total} frames", end='', flush=True)
+
+    started = time.perf_counter()
+    try:
+        rows = export_logs(args.logs, args.output, args.format, progress=report)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"\nErro ao exportar: {e}\n")
+    print(f"\n{rows} frames exportados para {args.output} em {time.perf_counter() - started:.1f} s")
@@ -0,0 +1,333 @@
+# Flight recorder: append-only telemetry log in fixed-size columnar chunks, and a replay source for it
+# === Imports ===
+import asyncio
+import binascii
+import bisect
+import os
+import struct
+import threading
+import time
+from array import array
+
+from UAV_Telemetry import TELEMETRY_FIELDS
+
+# === Constants ===
+# File = 64-byte header, then chunks of CHUNK_ROWS rows. Every chunk has the same size whether full or not,
+# so chunk i lives at HEADER_SIZE + i * chunk_size and the file can be memory-mapped as an array of chunks.
+LOG_MAGIC = b'UAVLOG\x00\x01'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<8sHHId40x')            # magic, version, fields, chunk rows, start time
+CHUNK_MAGIC = b'CHNK'
+CHUNK_HEADER = struct.Struct('<4sIddII')            # magic, rows, first time, last time, crc32, reserved
+CHUNK_ROWS = 256
+FLUSH_INTERVAL = 5.0                                # s between fsyncs (and sealing a partial chunk)
+LOG_EXTENSION = ".uavlog"
+
+# Column order and types inside a chunk: receive time and lat/lon in double, the rest in float
+LOG_COLUMNS = (('time', 'd'),) + tuple((name, 'd' if name in ('lat', 'lon') else 'f') for name in TELEMETRY_FIELDS)
+
+REPLAY_TICK = 0.02                                  # s; frames due within a tick are delivered together
+MIN_REPLAY_SPEED = 1.0
+MAX_REPLAY_SPEED = 100.0
+
+
+def chunk_size(chunk_rows=CHUNK_ROWS):
+    return CHUNK_HEADER.size + chunk_rows * sum(array(code).itemsize for _, code in LOG_COLUMNS)
+
+
+def chunk_crc(header_prefix, payload):
+    return binascii.crc32(payload, binascii.crc32(header_prefix))
+
+
+def read_log_header(f, path):
+    # -> (chunk rows, start time) of an open .uavlog; ValueError for anything else, including an empty file
+    header = f.read(LOG_HEADER.size)
+    if len(header) < LOG_HEADER.size:
+        raise ValueError(f"{path}: não é um registo de voo")
+    magic, version, fields, chunk_rows, start_time = LOG_HEADER.unpack(header)
+    if magic != LOG_MAGIC or fields != len(LOG_COLUMNS) or not chunk_rows:
+        raise ValueError(f"{path}: não é um registo de voo")
+    if version != LOG_VERSION:
+        raise ValueError(f"{path}: versão {version} não suportada")
+    return chunk_rows, start_time
+
+
+# === Recorder ===
+class FlightRecorder:
+    """Appends telemetry frames with their receive time to a .uavlog file.
+
+    Rows collect in column arrays; a full chunk is sealed at once, a partial one every `flush_interval`
+    by run(), which also fsyncs. After a crash at most the last interval is lost, and a torn chunk at
+    the tail is cut off when the file is reopened for appending. If a write fails the recorder stops and
+    drops further rows (`failed`) rather than buffering them with nowhere to go.
+    """
+
+    def __init__(self, path, chunk_rows=CHUNK_ROWS, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.failed = False
+        self._lock = threading.Lock()       # _write() may still be running in its thread when close() is called
+        self._columns = [array(code) for _, code in LOG_COLUMNS]
+        self._sealed = []
+        self._wake = None
+        self._file = self._open()
+
+    def _open(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < LOG_HEADER.size:
+            f = open(self.path, 'wb')
+            f.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, len(LOG_COLUMNS), self.chunk_rows, time.time()))
+            f.flush()
+            return f
+        log = FlightLog(self.path)
+        self.chunk_rows = log.chunk_rows
+        self.rows_written = log.rows
+        log.close()
+        f = open(self.path, 'r+b')
+        # Drop whatever follows the last complete, valid chunk
+        f.truncate(LOG_HEADER.size + log.chunks * chunk_size(self.chunk_rows))
+        f.seek(0, os.SEEK_END)
+        return f
+
+    def append(self, frame, timestamp=None):
+        if self.failed:
+            return
+        columns = self._columns
+        columns[0].append(time.time() if timestamp is None else timestamp)
+        for column, value in zip(columns[1:], frame):
+            column.append(value)
+        if len(columns[0]) >= self.chunk_rows:
+            self._seal()
+
+    def append_batch(self, frames, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        for frame in frames:
+            self.append(frame, timestamp)
+
+    def _seal(self):
+        columns, self._columns = self._columns, [array(code) for _, code in LOG_COLUMNS]
+        rows = len(columns[0])
+        if not rows or self.failed:
+            return
+        padding = self.chunk_rows - rows
+        payload = b''.join(column.tobytes() + bytes(padding * column.itemsize) for column in columns)
+        prefix = CHUNK_HEADER.pack(CHUNK_MAGIC, rows, columns[0][0], columns[0][-1], 0, 0)[:24]
+        self._sealed.append(CHUNK_HEADER.pack(CHUNK_MAGIC, rows, columns[0][0], columns[0][-1],
+                                              chunk_crc(prefix, payload), 0) + payload)
+        self.rows_written += rows
+        if self._wake is not None:
+            self._wake.set()
+
+    def _write(self, chunks, sync):
+        # Blocking; called with chunks already taken off the recorder
+        with self._lock:
+            if self._file is None or self.failed:
+                return
+            try:
+                if chunks:
+                    self._file.write(b''.join(chunks))
+                    self._file.flush()
+                if sync:
+                    os.fsync(self._file.fileno())
+            except OSError as e:
+                print(f"[Registo] Erro ao gravar {self.path}, gravação parada: {e}")
+                self.failed = True
+                self._sealed = []
+
+    def flush(self):
+        self._seal()
+        chunks, self._sealed = self._sealed, []
+        self._write(chunks, sync=True)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    async def run(self):
+        # IOCore coroutine: writes full chunks as they are sealed, seals and fsyncs the rest periodically
+        self._wake = asyncio.Event()
+        deadline = time.monotonic() + self.flush_interval
+        write = None
+        try:
+            while not self.failed:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                sync = time.monotonic() >= deadline
+                if sync:
+                    self._seal()
+                    deadline = time.monotonic() + self.flush_interval
+                chunks, self._sealed = self._sealed, []
+                # Shielded so a cancel doesn't orphan the write; finally waits for it before close() appends more
+                write = asyncio.ensure_future(asyncio.to_thread(self._write, chunks, sync))
+                await asyncio.shield(write)
+        finally:
+            self._wake = None
+            if write is not None and not write.done():
+                await asyncio.wait([write])
+            self.close()
+
+
+# === Reader ===
+class FlightLog:
+    """Read access to a .uavlog file. The time index is the (first, last) time of every chunk header,
+    so seeking is a binary search plus one chunk read."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._read_index()
+        except Exception:
+            self._file.close()
+            raise
+
+    def _read_index(self):
+        path = self.path
+        self.chunk_rows, self.start_time = read_log_header(self._file, path)
+        self.chunk_size = chunk_size(self.chunk_rows)
+        self.first_times = []
+        self.last_times = []
+        self.chunk_lengths = []
+        complete = (os.path.getsize(path) - LOG_HEADER.size) // self.chunk_size
+        for i in range(complete):
+            self._file.seek(LOG_HEADER.size + i * self.chunk_size)
+            magic, rows, first, last, _, _ = CHUNK_HEADER.unpack(self._file.read(CHUNK_HEADER.size))
+            if magic != CHUNK_MAGIC or not 0 < rows <= self.chunk_rows:
+                break
+            self.first_times.append(first)
+            self.last_times.append(last)
+            self.chunk_lengths.append(rows)
+        if self.first_times and self.read_chunk(len(self.first_times) - 1) is None:
+            # Torn tail from a crash mid-write
+            for index in (self.first_times, self.last_times, self.chunk_lengths):
+                index.pop()
+        self.chunks = len(self.first_times)
+        self.rows = sum(self.chunk_lengths)
+
+    @property
+    def begin(self):
+        return self.first_times[0] if self.chunks else self.start_time
+
+    @property
+    def end(self):
+        return self.last_times[-1] if self.chunks else self.start_time
+
+    def read_chunk(self, index):
+        # -> list of column arrays (time first), or None when the chunk fails its CRC
+        self._file.seek(LOG_HEADER.size + index * self.chunk_size)
+        raw = self._file.read(self.chunk_size)
+        magic, rows, first, last, crc, _ = CHUNK_HEADER.unpack_from(raw)
+        payload = memoryview(raw)[CHUNK_HEADER.size:]
+        if magic != CHUNK_MAGIC or chunk_crc(raw[:24], payload) != crc:
+            return None
+        columns = []
+        offset = 0
+        for _, code in LOG_COLUMNS:
+            column = array(code)
+            column.frombytes(payload[offset:offset + rows * column.itemsize])
+            columns.append(column)
+            offset += self.chunk_rows * column.itemsize
+        return columns
+
+    def chunk_at(self, timestamp):
+        return max(0, bisect.bisect_right(self.first_times, timestamp) - 1)
+
+    def frames(self, start=None):
+        # Yields (receive time, frame tuple) from `start` (absolute time) onwards
+        first = 0 if start is None else self.chunk_at(start)
+        for index in range(first, self.chunks):
+            columns = self.read_chunk(index)
+            if columns is None:
+                print(f"[Registo] Bloco {index} corrompido em {self.path}, ignorado")
+                continue
+            for row in zip(*columns):
+                if start is None or row[0] >= start:
+                    yield row[0], row[1:]
+
+    def close(self):
+        self._file.close()
+
+
+# === Replay ===
+class ReplaySource:
+    """Telemetry source that plays a .uavlog back through a TelemetryFeed at 1x-100x, with seek."""
+
+    def __init__(self, core, path, speed=1.0, on_frames=None):
+        self.core = core
+        self.log = FlightLog(path)
+        self.speed = speed
+        self.on_frames = on_frames
+        self.position = self.log.begin
+        self._seek_to = None
+        self._enabled = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = self.core.spawn(self.run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def set_active(self, active):
+        if active:
+            self._enabled.set()
+        else:
+            self._enabled.clear()
+
+    def seek(self, offset_s):
+        # Any thread; seconds from the start of the recording, applied before the next batch
+        self._seek_to = self.log.begin + max(0.0, offset_s)
+
+    def set_speed(self, speed):
+        self.speed = max(MIN_REPLAY_SPEED, min(MAX_REPLAY_SPEED, speed))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                start, self._seek_to = self._seek_to, None
+                frames = self.log.frames(start)
+                anchor_log = anchor_wall = None
+                batch = []
+                for timestamp, frame in frames:
+                    if not self._enabled.is_set():
+                        await self._enabled.wait()
+                        anchor_log = None
+                    if self._seek_to is not None:
+                        break
+                    if anchor_log is None or self.speed != anchor_speed:
+                        anchor_log, anchor_wall, anchor_speed = timestamp, loop.time(), self.speed
+                    due = anchor_wall + (timestamp - anchor_log) / anchor_speed
+                    if due - loop.time() > REPLAY_TICK:
+                        if batch and self.on_frames:
+                            self.on_frames(batch)
+                        batch = []
+                        await asyncio.sleep(due - loop.time())
+                    batch.append(frame)
+                    self.position = timestamp
+                else:
+                    if batch and self.on_frames:
+                        self.on_frames(batch)
+                    print(f"[Replay] Fim de {self.log.path}")
+                    await self._wait_for_seek()
+                    continue
+                if batch and self.on_frames:
+                    self.on_frames(batch)
+        finally:
+            self.log.close()
+
+    async def _wait_for_seek(self):
+        while self._seek_to is None:
+            await asyncio.sleep(REPLAY_TICK * 5)
@@ -0,0 +1,227 @@
+# Deterministic kinematic flight simulator: flies a waypoint mission and produces telemetry frames
+# === Imports ===
+import argparse
+import math
+import os
+import random
+import stat
+import sys
+import time
+
+import serial
+
+from UAV_Mission import EARTH_RADIUS_M, MissionFileError, distance_m, load_mission
+from UAV_Telemetry import format_telemetry_line, pack_binary_frame
+
+# === Constants ===
+GRAVITY = 9.81
+MIN_RATE_HZ = 1.0
+MAX_RATE_HZ = 200.0
+DEFAULT_ALTITUDE = 100.0
+GPS_ERROR_TAU = 5.0   # s, correlation time of the GPS position error
+
+# Per-cell LiPo open-circuit voltage against state of charge
+LIPO_OCV = ((0.0, 3.30), (0.05, 3.50), (0.10, 3.60), (0.20, 3.70), (0.40, 3.78), (0.60, 3.87),
+            (0.80, 4.00), (0.90, 4.08), (1.0, 4.20))
+
+VEHICLES = {
+    'fixed_wing': {'cruise_speed': 18.0, 'acceleration': 2.0, 'max_bank': 35.0, 'attitude_tau': 0.5,
+                   'climb_rate': 3.0, 'acceptance_m': 30.0, 'cruise_current': 14.0, 'capacity_mah': 5000.0,
+                   'cells': 4, 'internal_ohm': 0.08},
+    'multirotor': {'cruise_speed': 10.0, 'acceleration': 3.0, 'max_yaw_rate': 90.0, 'max_tilt': 25.0,
+                   'attitude_tau': 0.3, 'climb_rate': 3.0, 'acceptance_m': 5.0, 'cruise_current': 28.0,
+                   'capacity_mah': 6000.0, 'cells': 4, 'internal_ohm': 0.06},
+}
+
+
+def _wrap180(angle):
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def lipo_voltage(state_of_charge, cells):
+    soc = _clamp(state_of_charge, 0.0, 1.0)
+    for (soc0, v0), (soc1, v1) in zip(LIPO_OCV, LIPO_OCV[1:]):
+        if soc <= soc1:
+            return cells * (v0 + (v1 - v0) * (soc - soc0) / (soc1 - soc0))
+    return cells * LIPO_OCV[-1][1]
+
+
+# === Flight Simulator ===
+class FlightSimulator:
+    """Point-mass kinematics along a looping waypoint mission.
+
+    Time only advances through step(dt) and all noise comes from a seeded RNG, so the same seed, mission
+    and rate always give the same frames. Positions are integrated in metres on a local tangent plane.
+    """
+
+    def __init__(self, mission, vehicle='fixed_wing', seed=0, altitude=DEFAULT_ALTITUDE, gps_noise_m=1.5,
+                 turbulence_deg=1.0, wind_speed=0.0, wind_from=270.0, state_of_charge=1.0):
+        self.mission = [(p[0], p[1], p[2] if len(p) > 2 else altitude) for p in mission]
+        if not self.mission:
+            raise ValueError("missão sem waypoints")
+        self.vehicle = vehicle
+        self.params = VEHICLES[vehicle]
+        self.rng = random.Random(seed)
+        self.gps_noise_m = gps_noise_m
+        self.turbulence_deg = turbulence_deg
+        self.wind_speed = wind_speed
+        self.wind_from = wind_from
+        self.state_of_charge = state_of_charge
+
+        self.origin = self.mission[0][:2]
+        self.north = self.east = 0.0
+        self.altitude = 0.0 if vehicle == 'multirotor' else self.mission[0][2]
+        self.speed = 0.0 if vehicle == 'multirotor' else self.params['cruise_speed']
+        self.heading = self._bearing_to(1 % len(self.mission))
+        self.roll = self.pitch = 0.0
+        self.climb = 0.0
+        self.current = 0.0
+        self.target_index = 1 % len(self.mission)
+        self.gps_error = [0.0, 0.0]
+        self.time = 0.0
+        self.seq = 0
+
+    def position(self):
+        lat0, lon0 = self.origin
+        lat = lat0 + math.degrees(self.north / EARTH_RADIUS_M)
+        lon = lon0 + math.degrees(self.east / (EARTH_RADIUS_M * math.cos(math.radians(lat0))))
+        return lat, lon
+
+    def _local(self, lat, lon):
+        lat0, lon0 = self.origin
+        north = math.radians(lat - lat0) * EARTH_RADIUS_M
+        east = math.radians(lon - lon0) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
+        return north, east
+
+    def _bearing_to(self, index):
+        north, east = self._local(*self.mission[index][:2])
+        return math.degrees(math.atan2(east - self.east, north - self.north)) % 360
+
+    def step(self, dt):
+        # Advance the model by dt seconds -> (lat, lon, heading, altitude, speed km/h, battery V, roll, pitch)
+        p = self.params
+        lat, lon = self.position()
+        target_lat, target_lon, target_alt = self.mission[self.target_index]
+        if distance_m(lat, lon, target_lat, target_lon) < p['acceptance_m']:
+            self.target_index = (self.target_index + 1) % len(self.mission)
+            target_lat, target_lon, target_alt = self.mission[self.target_index]
+        heading_error = _wrap180(self._bearing_to(self.target_index) - self.heading)
+        lag = min(1.0, dt / p['attitude_tau'])
+
+        accel = _clamp((p['cruise_speed'] - self.speed) / dt, -p['acceleration'], p['acceleration'])
+        self.speed += accel * dt
+
+        if self.vehicle == 'fixed_wing':
+            # Coordinated turn: bank towards the target, turn rate follows from the bank angle
+            self.roll += (_clamp(heading_error, -p['max_bank'], p['max_bank']) - self.roll) * lag
+            yaw_rate = math.degrees(GRAVITY * math.tan(math.radians(self.roll)) / max(self.speed, 1.0))
+            self.climb = _clamp((target_alt - self.altitude) * 0.3, -p['climb_rate'], p['climb_rate'])
+            pitch_target = math.degrees(math.atan2(self.climb, max(self.speed, 1.0)))
+        else:
+            # Multirotor yaws in place; tilt comes from the horizontal accelerations
+            yaw_rate = _clamp(heading_error / dt, -p['max_yaw_rate'], p['max_yaw_rate'])
+            lateral = self.speed * math.radians(yaw_rate)
+            self.roll += (_clamp(math.degrees(math.atan2(lateral, GRAVITY)), -p['max_tilt'], p['max_tilt'])
+                          - self.roll) * lag
+            self.climb = _clamp((target_alt - self.altitude) * 0.5, -p['climb_rate'], p['climb_rate'])
+            drag_tilt = math.atan2(accel + 0.02 * self.speed ** 2, GRAVITY)
+            pitch_target = _clamp(-math.degrees(drag_tilt), -p['max_tilt'], p['max_tilt'])
+        self.pitch += (pitch_target - self.pitch) * lag
+        self.heading = (self.heading + yaw_rate * dt) % 360.0
+        self.altitude += self.climb * dt
+
+        wind_to = math.radians(self.wind_from + 180.0)
+        heading_rad = math.radians(self.heading)
+        self.north += (self.speed * math.cos(heading_rad) + self.wind_speed * math.cos(wind_to)) * dt
+        self.east += (self.speed * math.sin(heading_rad) + self.wind_speed * math.sin(wind_to)) * dt
+
+        # Current grows with airspeed squared and with climb; voltage sags under load
+        load = (self.speed / p['cruise_speed']) ** 2 if self.vehicle == 'fixed_wing' else 1.0
+        self.current = p['cruise_current'] * (0.6 + 0.4 * load) * (1.0 + max(self.climb, 0.0) / 10.0)
+        self.state_of_charge -= self.current * dt / 3.6 / p['capacity_mah']
+        battery = max(0.0, lipo_voltage(self.state_of_charge, p['cells']) - self.current * p['internal_ohm'])
+
+        # GPS error is a first-order random walk, so consecutive fixes wander instead of jumping
+        alpha = math.exp(-dt / GPS_ERROR_TAU)
+        for axis in (0, 1):
+            self.gps_error[axis] = (alpha * self.gps_error[axis]
+                                    + self.rng.gauss(0.0, self.gps_noise_m * math.sqrt(1.0 - alpha * alpha)))
+        lat, lon = self.position()
+        lat += math.degrees(self.gps_error[0] / EARTH_RADIUS_M)
+        lon += math.degrees(self.gps_error[1] / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+
+        self.time += dt
+        self.seq += 1
+        return (lat, lon, self.heading, self.altitude, self.speed * 3.6, battery,
+                self.roll + self.rng.gauss(0.0, self.turbulence_deg),
+                self.pitch + self.rng.gauss(0.0, self.turbulence_deg))
+
+
+def encode_frame(seq, frame, binary=False):
+    return pack_binary_frame(seq, *frame) if binary else format_telemetry_line(*frame).encode()
+
+
+def open_output(target, baud_rate):
+    # "-" is stdout (for pipes), an existing non-tty path is written as a file/FIFO, anything else is a serial port
+    if target == '-':
+        return sys.stdout.buffer
+    try:
+        mode = os.stat(target).st_mode
+        if stat.S_ISFIFO(mode) or stat.S_ISREG(mode):
+            return open(target, 'wb', buffering=0)
+    except OSError:
+        pass
+    return serial.Serial(target, baud_rate)
+
+
+def run(sim, out, rate_hz, duration=None, binary=False, realtime=True):
+    # Paced against a fixed schedule so the rate doesn't drift; realtime=False runs as fast as the output allows
+    period = 1.0 / rate_hz
+    next_tick = time.monotonic()
+    while duration is None or sim.time < duration:
+        frame = sim.step(period)
+        out.write(encode_frame(sim.seq, frame, binary))
+        if realtime:
+            out.flush()
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -1.0:
+                next_tick = time.monotonic()
+
+
+# === Main ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador de voo determinístico para a estação terrestre")
+    parser.add_argument("--out", default='-', help="porta série, PTY, FIFO/ficheiro ou - para stdout")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--rate", type=float, default=10.0, help=f"Hz ({MIN_RATE_HZ:.0f}-{MAX_RATE_HZ:.0f})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--vehicle", choices=sorted(VEHICLES), default='fixed_wing')
+    parser.add_argument("--mission", help="missão gravada pela estação (.jsonl, ou .json antigo)")
+    parser.add_argument("--duration", type=float, help="segundos de voo simulado")
+    parser.add_argument("--binary", action="store_true", help="frames binários em vez de CSV")
+    parser.add_argument("--fast", action="store_true", help="sem espera entre frames (testes de carga)")
+    args = parser.parse_args()
+    if not MIN_RATE_HZ <= args.rate <= MAX_RATE_HZ:
+        parser.error(f"--rate tem de estar entre {MIN_RATE_HZ:.0f} e {MAX_RATE_HZ:.0f} Hz")
+
+    if args.mission:
+        try:
+            mission = load_mission(args.mission)
+        except (OSError, MissionFileError) as e:
+            parser.error(str(e))
+    else:
+        mission = [(41.002381, -8.638930), (41.003073, -8.638234), (41.003070, -8.636365),
+                   (41.001082, -8.636363), (41.001154, -8.638493), (41.002130, -8.638588)]
+    sim = FlightSimulator(mission, vehicle=args.vehicle, seed=args.seed)
+    out = open_output(args.out, args.baud)
+    try:
+        run(sim, out, args.rate, args.duration, args.binary, realtime=not args.fast)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
@@ -0,0 +1,53 @@
+# asyncio event loop shared by the UAV ground station's I/O (serial link, simulator, uploads, recorder)
+# === Imports ===
+import asyncio
+import threading
+
+# === Constants ===
+STOP_TIMEOUT = 2.0
+
+
+# === I/O Core ===
+class IOCore:
+    """Runs one asyncio loop on a dedicated thread. The GUI thread hands it coroutines with `spawn`,
+    which returns a concurrent.futures.Future; cancelling that future cancels the coroutine."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return self
+        self._thread = threading.Thread(target=self._run, name="IOCore", daemon=True)
+        self._thread.start()
+        return self
+
+    def spawn(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        # Thread-safe: runs `callback(*args)` on the loop thread
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self):
+        if not self._thread:
+            return
+        self.loop.call_soon_threadsafe(self._shutdown)
+        self._thread.join(timeout=STOP_TIMEOUT)
+        self._thread = None
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _shutdown(self):
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+
+        async def drain():
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop.stop()
+
+        self.loop.create_task(drain())
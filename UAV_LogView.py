@@ -0,0 +1,128 @@
+# Memory-mapped view of .uavlog flight recordings for post-flight analysis
+# === Imports ===
+import argparse
+import os
+import time
+
+import numpy as np
+
+from UAV_FlightLog import CHUNK_HEADER, CHUNK_MAGIC, LOG_COLUMNS, LOG_HEADER, chunk_crc, chunk_size, read_log_header
+from UAV_Telemetry import TELEMETRY_FIELDS
+
+# === Constants ===
+TRACK_LOD_POINTS = 2000   # overview track budget, whatever the length of the flight
+
+
+def chunk_dtype(chunk_rows):
+    # One chunk as a numpy record: the 32-byte chunk header, then every column padded to chunk_rows
+    header = [('magic', 'S4'), ('rows', '<u4'), ('first', '<f8'), ('last', '<f8'), ('crc', '<u4'), ('reserved', '<u4')]
+    columns = [(name, ('<f8' if code == 'd' else '<f4', (chunk_rows,))) for name, code in LOG_COLUMNS]
+    dtype = np.dtype(header + columns)
+    assert dtype.itemsize == chunk_size(chunk_rows)
+    return dtype
+
+
+# === Log View ===
+class LogView:
+    """Read-only numpy.memmap over a .uavlog file.
+
+    Opening reads the file header and the time fields of the chunk headers; telemetry rows are paged in by
+    the OS only when frame_at() or track() touch them, so a multi-GB recording costs no RAM up front.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.chunk_rows, self.start_time = read_log_header(f, path)
+        try:
+            self._map()
+        except Exception:
+            self.close()
+            raise
+
+    def _map(self):
+        path = self.path
+        dtype = chunk_dtype(self.chunk_rows)
+        complete = (os.path.getsize(path) - LOG_HEADER.size) // dtype.itemsize
+        if complete:
+            self.chunks = np.memmap(path, dtype=dtype, mode='r', offset=LOG_HEADER.size, shape=(complete,))
+        else:
+            self.chunks = np.zeros(0, dtype=dtype)
+
+        # Same rules as FlightLog: stop at the first bad header and drop a torn last chunk
+        rows = self.chunks['rows']
+        bad = np.flatnonzero((self.chunks['magic'] != CHUNK_MAGIC) | (rows == 0) | (rows > self.chunk_rows))
+        count = int(bad[0]) if len(bad) else complete
+        if count and not self._chunk_ok(count - 1):
+            count -= 1
+        self.chunks = self.chunks[:count]
+        self.chunk_lengths = np.array(self.chunks['rows'], dtype=np.int64)
+        self.first_times = np.array(self.chunks['first'])
+        self.last_times = np.array(self.chunks['last'])
+        self.rows = int(self.chunk_lengths.sum())
+
+    def _chunk_ok(self, index):
+        raw = self.chunks[index:index + 1].tobytes()
+        return chunk_crc(raw[:24], raw[CHUNK_HEADER.size:]) == int(self.chunks['crc'][index])
+
+    @property
+    def begin(self):
+        return float(self.first_times[0]) if len(self.chunks) else self.start_time
+
+    @property
+    def end(self):
+        return float(self.last_times[-1]) if len(self.chunks) else self.start_time
+
+    def _chunk_range(self, start, end):
+        first = 0 if start is None else max(0, int(np.searchsorted(self.first_times, start, 'right')) - 1)
+        last = len(self.chunks) if end is None else int(np.searchsorted(self.first_times, end, 'right'))
+        return first, max(first, last)
+
+    def frame_at(self, timestamp):
+        # Last frame received at or before `timestamp` -> telemetry tuple (None for an empty log)
+        if not len(self.chunks):
+            return None
+        index, _ = self._chunk_range(timestamp, None)
+        rows = self.chunk_lengths[index]
+        row = max(0, int(np.searchsorted(self.chunks['time'][index, :rows], timestamp, 'right')) - 1)
+        return tuple(float(self.chunks[name][index, row]) for name in TELEMETRY_FIELDS)
+
+    def track(self, max_points=TRACK_LOD_POINTS, start=None, end=None):
+        # Level-of-detail track: every n-th fix so that at most ~max_points come back -> [(lat, lon), ...]
+        first, last = self._chunk_range(start, end)
+        if first == last:
+            return []
+        per_chunk = max_points // (last - first)
+        if per_chunk < 1:
+            # Coarse levels take the first fix of every k-th chunk: one page touched per sample
+            picked = np.arange(first, last, -(-(last - first) // max_points))
+            columns = [self.chunks[name][picked, 0] for name in ('time', 'lat', 'lon')]
+        else:
+            lengths = self.chunk_lengths[first:last]
+            offsets = np.arange(0, self.chunk_rows, -(-self.chunk_rows // per_chunk))
+            valid = offsets[None, :] < lengths[:, None]
+            columns = [self.chunks[name][first:last][:, offsets][valid] for name in ('time', 'lat', 'lon')]
+        times, lat, lon = columns
+        keep = np.ones(len(times), dtype=bool)
+        if start is not None:
+            keep &= times >= start
+        if end is not None:
+            keep &= times <= end
+        return list(zip(lat[keep].tolist(), lon[keep].tolist()))
+
+    def close(self):
+        self.chunks = None
+
+
+# === Main ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumo de um registo de voo (.uavlog)")
+    parser.add_argument("log")
+    args = parser.parse_args()
+
+    opened = time.perf_counter()
+    view = LogView(args.log)
+    opened = time.perf_counter() - opened
+    print(f"{args.log}: {view.rows} frames em {len(view.chunks)} blocos, "
+          f"{(view.end - view.begin) / 60:.1f} min de voo (aberto em {opened * 1000:.0f} ms)")
+    print(f"Primeiro: {view.frame_at(view.begin)}\nÚltimo: {view.frame_at(view.end)}")
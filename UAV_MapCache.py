@@ -0,0 +1,156 @@
+# Offline map tiles for the UAV ground station: SQLite z/x/y cache plus a prefetcher for the mission area
+# === Imports ===
+import argparse
+import math
+import sqlite3
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from UAV_Mission import EARTH_RADIUS_M, MissionFileError, load_mission
+
+# === Constants ===
+# Same tables as tkintermapview's OfflineLoader, so TkinterMapView(database_path=...) reads the cache directly
+TILE_DATABASE = "offline_tiles.db"
+TILE_SERVER = "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png"
+TILE_MAX_ZOOM = 19
+PREFETCH_ZOOM = (12, 18)
+PREFETCH_MARGIN_M = 300.0
+PREFETCH_WORKERS = 4
+FETCH_TIMEOUT = 10
+COMMIT_EVERY = 100
+USER_AGENT = "UAV-GroundStation/1.0 (offline prefetch)"
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS server (
+           url VARCHAR(300) PRIMARY KEY NOT NULL,
+           max_zoom INTEGER NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS tiles (
+           zoom INTEGER NOT NULL,
+           x INTEGER NOT NULL,
+           y INTEGER NOT NULL,
+           server VARCHAR(300) NOT NULL,
+           tile_image BLOB NOT NULL,
+           CONSTRAINT fk_server FOREIGN KEY (server) REFERENCES server (url),
+           CONSTRAINT pk_tiles PRIMARY KEY (zoom, x, y, server))""",
+)
+
+
+def tile_xy(lat, lon, zoom):
+    # Web Mercator lat/lon -> fractional OSM tile coordinates
+    n = 2 ** zoom
+    lat_rad = math.radians(lat)
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
+    return x, y
+
+
+def mission_bounds(points, margin_m=PREFETCH_MARGIN_M):
+    # -> (top_left, bottom_right) around the waypoints plus a margin, or None for an empty mission
+    points = list(points)
+    if not points:
+        return None
+    lats = [lat for lat, _ in points]
+    lons = [lon for _, lon in points]
+    dlat = math.degrees(margin_m / EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(sum(lats) / len(lats))), 0.01)
+    return (max(lats) + dlat, min(lons) - dlon), (min(lats) - dlat, max(lons) + dlon)
+
+
+def tile_range(top_left, bottom_right, zoom):
+    x0, y0 = tile_xy(*top_left, zoom)
+    x1, y1 = tile_xy(*bottom_right, zoom)
+    last = 2 ** zoom - 1
+    xs = range(max(0, math.floor(x0)), min(last, math.floor(x1)) + 1)
+    ys = range(max(0, math.floor(y0)), min(last, math.floor(y1)) + 1)
+    return xs, ys
+
+
+def open_tile_database(path=TILE_DATABASE, tile_server=TILE_SERVER, max_zoom=TILE_MAX_ZOOM):
+    db = sqlite3.connect(path, timeout=10)
+    for statement in SCHEMA:
+        db.execute(statement)
+    db.execute("INSERT OR IGNORE INTO server (url, max_zoom) VALUES (?, ?)", (tile_server, max_zoom))
+    db.commit()
+    return db
+
+
+def missing_tiles(db, top_left, bottom_right, zoom_min, zoom_max, tile_server=TILE_SERVER):
+    # Tiles already in the cache are skipped, so a prefetch can be repeated or widened cheaply
+    missing = []
+    for zoom in range(zoom_min, zoom_max + 1):
+        xs, ys = tile_range(top_left, bottom_right, zoom)
+        cached = set(db.execute(
+            "SELECT x, y FROM tiles WHERE zoom=? AND server=? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?",
+            (zoom, tile_server, xs.start, xs.stop - 1, ys.start, ys.stop - 1)))
+        missing.extend((zoom, x, y) for x in xs for y in ys if (x, y) not in cached)
+    return missing
+
+
+def fetch_tile(tile_server, zoom, x, y):
+    url = tile_server.replace("{z}", str(zoom)).replace("{x}", str(x)).replace("{y}", str(y))
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+        return response.read()
+
+
+def prefetch_tiles(top_left, bottom_right, zoom_min, zoom_max, database_path=TILE_DATABASE,
+                   tile_server=TILE_SERVER, progress=None, stop_event=None):
+    """Download every tile of the box for zooms zoom_min..zoom_max that is not cached yet.
+
+    Blocking; run it off the UI thread. `progress(done, total, failed)` is called from this thread.
+    Returns (downloaded, failed).
+    """
+    db = open_tile_database(database_path, tile_server)
+    try:
+        tasks = missing_tiles(db, top_left, bottom_right, zoom_min, zoom_max, tile_server)
+        done = failed = 0
+        if progress:
+            progress(done, len(tasks), failed)
+        with ThreadPoolExecutor(max_workers=PREFETCH_WORKERS) as pool:
+            futures = {pool.submit(fetch_tile, tile_server, *task): task for task in tasks}
+            for future in as_completed(futures):
+                if stop_event is not None and stop_event.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                try:
+                    image = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[Mapa] Falha no tile {futures[future]}: {e}")
+                else:
+                    # Downloads run in the pool; only this thread writes to SQLite
+                    db.execute("INSERT OR IGNORE INTO tiles (zoom, x, y, server, tile_image) VALUES (?, ?, ?, ?, ?)",
+                               (*futures[future], tile_server, image))
+                    done += 1
+                    if done % COMMIT_EVERY == 0:
+                        db.commit()
+                if progress:
+                    progress(done, len(tasks), failed)
+        db.commit()
+        return done, failed
+    finally:
+        db.close()
+
+
+# === Main ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pré-carrega os tiles do mapa para a área da missão")
+    parser.add_argument("mission", help="ficheiro de waypoints gravado pela estação")
+    parser.add_argument("--zoom", type=int, nargs=2, default=PREFETCH_ZOOM, metavar=("MIN", "MAX"))
+    parser.add_argument("--margin", type=float, default=PREFETCH_MARGIN_M, help="margem em metros")
+    parser.add_argument("--db", default=TILE_DATABASE)
+    args = parser.parse_args()
+
+    try:
+        bounds = mission_bounds([waypoint[:2] for waypoint in load_mission(args.mission)], args.margin)
+    except (OSError, MissionFileError) as e:
+        parser.error(str(e))
+    if bounds is None:
+        parser.error("missão sem waypoints")
+
+    def report(done, total, failed):
+        print(f"\r[Mapa] {done}/{total} tiles ({failed} falhas)", end="", flush=True)
+
+    downloaded, failures = prefetch_tiles(*bounds, *args.zoom, database_path=args.db, progress=report)
+    print(f"\n[Mapa] {downloaded} tiles gravados em {args.db}, {failures} falhas")
@@ -0,0 +1,395 @@
+# Flight track and mission data structures shared by the UAV ground station GUIs
+# === Imports ===
+import asyncio
+import collections
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from array import array
+
+# === Constants ===
+TRACK_CAPACITY = 20000
+TRACK_MIN_DISTANCE_M = 2.0
+EARTH_RADIUS_M = 6371000.0
+
+# Mission files: JSON Lines, a header line then one waypoint object per line
+MISSION_FORMAT = "uav-mission"
+MISSION_VERSION = 1
+MISSION_EXTENSION = ".jsonl"
+WAYPOINT_ACTIONS = ('waypoint', 'takeoff', 'loiter', 'land', 'rth')
+WAYPOINT_FIELDS = ('lat', 'lon', 'alt', 'speed', 'action')
+DEFAULT_WP_ALTITUDE = 100.0   # m
+DEFAULT_WP_SPEED = 10.0       # m/s
+MAX_REPORTED_ERRORS = 20
+
+# Autosave: every mission edit is appended to this journal and replayed at start-up if it was never saved
+MISSION_JOURNAL = "missao_autosave.jsonl"
+AUTOSAVE_INTERVAL = 2.0       # s between journal writes
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    # Equirectangular approximation, plenty for the short hops between consecutive fixes
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_M
+
+
+# === Flight Track ===
+class FlightTrack:
+    """Live track as a fixed-size ring of lat/lon/time; fixes closer than `min_distance_m` are dropped."""
+
+    def __init__(self, capacity=TRACK_CAPACITY, min_distance_m=TRACK_MIN_DISTANCE_M):
+        self.capacity = capacity
+        self.min_distance_m = min_distance_m
+        self.lat = array('d', bytes(8 * capacity))
+        self.lon = array('d', bytes(8 * capacity))
+        self.time = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, lat, lon, timestamp=None):
+        # Returns False when the fix was decimated away
+        if self.count:
+            last = (self.start + self.count - 1) % self.capacity
+            if distance_m(self.lat[last], self.lon[last], lat, lon) < self.min_distance_m:
+                return False
+        if self.count == self.capacity:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+        else:
+            index = (self.start + self.count) % self.capacity
+            self.count += 1
+        self.lat[index] = lat
+        self.lon[index] = lon
+        self.time[index] = time.time() if timestamp is None else timestamp
+        return True
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+
+# === Mission ===
+class Mission:
+    """Ordered mission waypoints with stable ids, stored column-wise in compact arrays.
+
+    Indexing and iteration give (lat, lon); waypoint(i) gives the full (lat, lon, alt, speed, action).
+    With a `journal`, every edit is also handed to journal.record() as a small op dict that apply() replays.
+    """
+
+    def __init__(self, points=(), journal=None):
+        self.ids = array('q')
+        self.lat = array('d')
+        self.lon = array('d')
+        self.alt = array('d')
+        self.speed = array('d')
+        self.action = []
+        self.next_id = 1
+        self.journal = None
+        self.extend(points)
+        self.journal = journal
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return self.lat[index], self.lon[index]
+
+    def __iter__(self):
+        return zip(self.lat, self.lon)
+
+    def _log(self, op):
+        if self.journal is not None:
+            self.journal.record(op)
+
+    def _add(self, lat, lon, alt=DEFAULT_WP_ALTITUDE, speed=DEFAULT_WP_SPEED, action='waypoint'):
+        wp_id = self.next_id
+        self.next_id += 1
+        self.ids.append(wp_id)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.alt.append(alt)
+        self.speed.append(speed)
+        self.action.append(action)
+        return wp_id
+
+    def append(self, lat, lon, alt=DEFAULT_WP_ALTITUDE, speed=DEFAULT_WP_SPEED, action='waypoint'):
+        wp_id = self._add(lat, lon, alt, speed, action)
+        self._log({'op': 'append', 'wp': self.waypoint(-1)})
+        return wp_id
+
+    def extend(self, waypoints):
+        # One journal op for the whole batch, not one per waypoint
+        count = len(self)
+        for waypoint in waypoints:
+            self._add(*waypoint)
+        if len(self) > count:
+            self._log({'op': 'extend', 'waypoints': self.waypoints()[count:]})
+
+    def update(self, index, lat, lon):
+        self.lat[index] = lat
+        self.lon[index] = lon
+        self._log({'op': 'update', 'index': index, 'lat': lat, 'lon': lon})
+        return self.ids[index]
+
+    def pop(self, index=-1):
+        wp_id = self.ids.pop(index)
+        for column in (self.lat, self.lon, self.alt, self.speed, self.action):
+            column.pop(index)
+        self._log({'op': 'pop', 'index': index})
+        return wp_id
+
+    def clear(self):
+        del self.ids[:], self.lat[:], self.lon[:], self.alt[:], self.speed[:], self.action[:]
+        self._log({'op': 'clear'})
+
+    def apply(self, op):
+        # Replays one journal op (KeyError/IndexError/TypeError if it is malformed)
+        kind = op['op']
+        if kind == 'append':
+            self.append(*op['wp'])
+        elif kind == 'extend':
+            self.extend(op['waypoints'])
+        elif kind == 'update':
+            self.update(op['index'], op['lat'], op['lon'])
+        elif kind == 'pop':
+            self.pop(op['index'])
+        elif kind == 'clear':
+            self.clear()
+        else:
+            raise KeyError(kind)
+
+    def points(self):
+        return list(zip(self.lat, self.lon))
+
+    def waypoint(self, index):
+        return self.lat[index], self.lon[index], self.alt[index], self.speed[index], self.action[index]
+
+    def waypoints(self):
+        return list(zip(self.lat, self.lon, self.alt, self.speed, self.action))
+
+    def close_loop(self):
+        # Appends home (first waypoint) as the last one unless the mission already ends there
+        if self and self[-1] != self[0]:
+            return self.append(*self.waypoint(0))
+        return None
+
+
+# === Mission Files ===
+class MissionFileError(ValueError):
+    """Invalid mission file; `errors` lists every bad record as (where, message), e.g. ("linha 12", ...)."""
+
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = errors
+        lines = [f"  {where}: {message}" for where, message in errors[:MAX_REPORTED_ERRORS]]
+        if len(errors) > MAX_REPORTED_ERRORS:
+            lines.append(f"  ... e mais {len(errors) - MAX_REPORTED_ERRORS}")
+        super().__init__(f"{path}: {len(errors)} registo(s) inválido(s)\n" + "\n".join(lines))
+
+
+def _number(record, name, low, high, default=None):
+    value = record.get(name, default)
+    if value is None:
+        raise ValueError(f"falta '{name}'")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"'{name}' tem de ser um número, não {value!r}")
+    if not low <= value <= high:
+        raise ValueError(f"'{name}' = {value} fora de [{low}, {high}]")
+    return float(value)
+
+
+def parse_waypoint(record):
+    # One mission record -> waypoint tuple; the ValueError names the offending field
+    if not isinstance(record, dict):
+        raise ValueError(f"esperado um objeto waypoint, não {type(record).__name__}")
+    unknown = set(record) - set(WAYPOINT_FIELDS)
+    if unknown:
+        raise ValueError(f"campo(s) desconhecido(s): {', '.join(sorted(unknown))}")
+    action = record.get('action', 'waypoint')
+    if action not in WAYPOINT_ACTIONS:
+        raise ValueError(f"'action' = {action!r}, esperado um de {', '.join(WAYPOINT_ACTIONS)}")
+    return (_number(record, 'lat', -90.0, 90.0), _number(record, 'lon', -180.0, 180.0),
+            _number(record, 'alt', -500.0, 10000.0, DEFAULT_WP_ALTITUDE),
+            _number(record, 'speed', 0.0, 100.0, DEFAULT_WP_SPEED), action)
+
+
+def _json_lines(f, first_line_no):
+    # ("linha n", decoded record or the ValueError saying why it isn't JSON), skipping blank lines.
+    # `f` is binary: each line is decoded on its own, so bad UTF-8 is one bad record, not a crash
+    for line_no, line in enumerate(f, first_line_no):
+        if line.strip():
+            try:
+                yield f"linha {line_no}", json.loads(line.decode("utf-8"))
+            except UnicodeDecodeError as e:
+                yield f"linha {line_no}", ValueError(f"UTF-8 inválido (coluna {e.start + 1})")
+            except ValueError as e:
+                yield f"linha {line_no}", ValueError(f"JSON inválido: {e.msg} (coluna {e.colno})")
+
+
+def _legacy_points(records):
+    # Old .json files: a plain list of [lat, lon]
+    for number, record in enumerate(records, 1):
+        if isinstance(record, list) and len(record) == 2:
+            record = {'lat': record[0], 'lon': record[1]}
+        yield f"ponto {number}", record
+
+
+def load_mission(path):
+    """Reads a mission file -> list of (lat, lon, alt, speed, action).
+
+    JSON Lines are decoded one line at a time; old .json files (a list of [lat, lon]) are still accepted.
+    Every record is validated and all errors come back together in one MissionFileError, so a file loads
+    whole or not at all.
+    """
+    waypoints = []
+    errors = []
+    with open(path, "rb") as f:
+        first = f.readline()
+        if first.lstrip().startswith(b'['):
+            try:
+                records = _legacy_points(json.loads((first + f.read()).decode("utf-8")))
+            except UnicodeDecodeError as e:
+                raise MissionFileError(path, [(f"byte {e.start + 1}", "UTF-8 inválido")])
+            except ValueError as e:
+                raise MissionFileError(path, [(f"linha {e.lineno}", f"JSON inválido: {e.msg}")])
+        else:
+            try:
+                header = json.loads(first.decode("utf-8"))
+            except ValueError:
+                header = None
+            if not isinstance(header, dict) or header.get('format') != MISSION_FORMAT:
+                raise MissionFileError(path, [("linha 1", f"cabeçalho '{MISSION_FORMAT}' em falta")])
+            if not isinstance(header.get('version'), int) or header['version'] > MISSION_VERSION:
+                raise MissionFileError(path, [("linha 1", f"versão {header.get('version')!r} não suportada")])
+            records = _json_lines(f, 2)
+        for where, record in records:
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                waypoints.append(parse_waypoint(record))
+            except ValueError as e:
+                errors.append((where, str(e)))
+    if errors:
+        raise MissionFileError(path, errors)
+    return waypoints
+
+
+def write_atomic(path, lines):
+    # Writes a temporary file next to `path` and renames it over, so readers see the old file or the new one
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def save_mission(waypoints, path):
+    header = json.dumps({'format': MISSION_FORMAT, 'version': MISSION_VERSION}) + "\n"
+    write_atomic(path, [header] + [json.dumps(dict(zip(WAYPOINT_FIELDS, waypoint))) + "\n" for waypoint in waypoints])
+
+
+# === Autosave Journal ===
+def replay_journal(path):
+    """-> (waypoints, unsaved): the mission rebuilt from a journal, and whether it changed after the last save.
+
+    Stops at the first line that isn't a valid op, which after a crash is a half-written last line.
+    """
+    mission = Mission()
+    unsaved = False
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return [], False
+    with f:
+        for line_no, line in enumerate(f, 1):
+            try:
+                op = json.loads(line)
+                if op.get('op') in ('saved', 'dirty'):
+                    unsaved = op['op'] == 'dirty'
+                    continue
+                mission.apply(op)
+                unsaved = True
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                print(f"[Autosave] {path}: linha {line_no} ilegível, recuperado até aí")
+                break
+    return mission.waypoints(), unsaved
+
+
+class MissionJournal:
+    """Append-only log of Mission edits, kept off the UI thread.
+
+    record() only queues the op (any thread). run(), on the IOCore loop, first recovers and compacts the
+    previous journal, then appends queued ops and fsyncs every `interval`. After a crash at most the
+    last interval of edits is lost.
+    """
+
+    def __init__(self, path=MISSION_JOURNAL, interval=AUTOSAVE_INTERVAL, on_recover=None):
+        self.path = path
+        self.interval = interval
+        self.on_recover = on_recover
+        self._pending = collections.deque()
+        self._file = None
+        self._lock = threading.Lock()    # a cancelled run() may leave a _write still running in its thread
+
+    def record(self, op):
+        self._pending.append(json.dumps(op) + "\n")
+
+    def mark_saved(self, path):
+        # Queue it together with the snapshot being saved, so later edits land after the marker
+        self.record({'op': 'saved', 'path': path})
+
+    def mark_dirty(self):
+        # A save queued with mark_saved() failed: the edits before it are unsaved again
+        self.record({'op': 'dirty'})
+
+    def _open(self):
+        # Keeps only what is worth restoring (unsaved waypoints) and swaps it in atomically
+        waypoints, unsaved = replay_journal(self.path)
+        recovered = waypoints if unsaved else []
+        write_atomic(self.path, [json.dumps({'op': 'extend', 'waypoints': recovered}) + "\n"] if recovered else [])
+        self._file = open(self.path, "a", encoding="utf-8")
+        return recovered
+
+    def _write(self):
+        with self._lock:
+            lines = []
+            while self._pending:
+                lines.append(self._pending.popleft())
+            if lines and self._file:
+                self._file.writelines(lines)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        self._write()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    async def run(self):
+        try:
+            recovered = await asyncio.to_thread(self._open)
+            if recovered and self.on_recover:
+                self.on_recover(recovered)
+            while True:
+                await asyncio.sleep(self.interval)
+                if self._pending:
+                    await asyncio.to_thread(self._write)
+        except OSError as e:
+            print(f"[Autosave] Desativado: {e}")
+        finally:
+            self.close()
@@ -0,0 +1,461 @@
+# Telemetry link shared by the UAV ground station GUIs (coroutines run on a UAV_IOCore.IOCore)
+# === Imports ===
+import asyncio
+import binascii
+import collections
+import queue
+import struct
+import threading
+import time
+import serial
+
+# === Constants ===
+TELEMETRY_FIELDS = ('lat', 'lon', 'heading', 'altitude', 'speed', 'battery', 'roll', 'pitch')
+READ_TIMEOUT = 0.1
+MIN_BACKOFF = 0.5
+MAX_BACKOFF = 8.0
+MAX_QUEUED_FRAMES = 1000
+RING_BUFFER_SIZE = 64 * 1024
+UPLOAD_WINDOW = 4
+UPLOAD_ACK_TIMEOUT = 1.0
+UPLOAD_RETRIES = 3
+
+# Binary frame: sync, seq, lat/lon (1e-7 deg), heading (0.01 deg), alt (0.1 m), speed (0.1 km/h),
+# battery (mV), roll/pitch (0.01 deg), CRC-16/CCITT over seq..pitch. 26 bytes vs ~55 for the CSV line.
+BINARY_SYNC = b'\xaa\x55'
+BINARY_FRAME = struct.Struct('<2sHiiHhHHhhH')
+
+# Vehicle replies to an uploaded "WP,n,lat,lon" line with "ACK,n" or "NAK,n"
+REPLY_PREFIXES = (b'ACK,', b'NAK,')
+
+
+def parse_telemetry_bytes(line):
+    # b"lat,lon,heading,alt,speed,battery,roll,pitch" -> tuple of 8 floats (ValueError if malformed)
+    fields = line.split(b',')
+    if len(fields) != len(TELEMETRY_FIELDS):
+        raise ValueError(f"esperados {len(TELEMETRY_FIELDS)} campos, recebidos {len(fields)}")
+    return tuple(map(float, fields))
+
+
+def format_telemetry_line(lat, lon, heading, altitude, speed, battery, roll, pitch):
+    return (f"{lat:.6f},{lon:.6f},{heading:.1f},{altitude:.1f},{speed:.1f},{battery:.2f},"
+            f"{roll:.1f},{pitch:.1f}\n")
+
+
+def parse_reply_bytes(line):
+    # b"ACK,3" -> ('ACK', 3) (ValueError if malformed)
+    kind, _, index = bytes(line).strip().partition(b',')
+    return kind.decode(), int(index)
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def pack_binary_frame(seq, lat, lon, heading, altitude, speed, battery, roll, pitch):
+    frame = bytearray(BINARY_FRAME.size)
+    BINARY_FRAME.pack_into(frame, 0, BINARY_SYNC, seq & 0xFFFF,
+                           round(lat * 1e7), round(lon * 1e7),
+                           round(heading * 100) % 36000,
+                           _clamp(round(altitude * 10), -32768, 32767),
+                           _clamp(round(speed * 10), 0, 65535),
+                           _clamp(round(battery * 1000), 0, 65535),
+                           _clamp(round(roll * 100), -32768, 32767),
+                           _clamp(round(pitch * 100), -32768, 32767),
+                           0)
+    crc = binascii.crc_hqx(frame[2:-2], 0xFFFF)
+    struct.pack_into('<H', frame, BINARY_FRAME.size - 2, crc)
+    return bytes(frame)
+
+
+def unpack_binary_frame(buf, offset=0):
+    # -> (seq, frame tuple), or None when the sync bytes or the CRC don't match
+    (sync, seq, lat, lon, heading, altitude, speed, battery, roll, pitch,
+     crc) = BINARY_FRAME.unpack_from(buf, offset)
+    if sync != BINARY_SYNC:
+        return None
+    if binascii.crc_hqx(memoryview(buf)[offset + 2:offset + BINARY_FRAME.size - 2], 0xFFFF) != crc:
+        return None
+    return seq, (lat / 1e7, lon / 1e7, heading / 100, altitude / 10, speed / 10,
+                 battery / 1000, roll / 100, pitch / 100)
+
+
+# === Telemetry Snapshot ===
+class TelemetrySnapshot:
+    """One complete, immutable telemetry frame; `seq` grows by one per published frame."""
+
+    __slots__ = ('seq', 'timestamp') + TELEMETRY_FIELDS
+
+    def __init__(self, seq, lat, lon, heading, altitude, speed, battery, roll, pitch, timestamp=None):
+        values = (seq, time.monotonic() if timestamp is None else timestamp,
+                  lat, lon, heading, altitude, speed, battery, roll, pitch)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TelemetrySnapshot é imutável")
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"TelemetrySnapshot({fields})"
+
+
+class TelemetryState:
+    """Holds the latest snapshot. Writers swap the reference; readers just read `snapshot`."""
+
+    def __init__(self, lat=0.0, lon=0.0, heading=0.0, altitude=0.0, speed=0.0, battery=0.0, roll=0.0, pitch=0.0):
+        self.snapshot = TelemetrySnapshot(0, lat, lon, heading, altitude, speed, battery, roll, pitch)
+        self._write_lock = threading.Lock()
+        self._listeners = []
+
+    def subscribe(self, callback):
+        # callback(snapshot) runs on the publishing thread, keep it short
+        self._listeners.append(callback)
+
+    def publish(self, lat, lon, heading, altitude, speed, battery, roll, pitch, timestamp=None):
+        with self._write_lock:
+            snapshot = TelemetrySnapshot(self.snapshot.seq + 1, lat, lon, heading, altitude, speed, battery,
+                                         roll, pitch, timestamp)
+            self.snapshot = snapshot
+        for callback in self._listeners:
+            callback(snapshot)
+        return snapshot
+
+
+# === Receive Buffer ===
+class TelemetryRingBuffer:
+    """Preallocated receive buffer: bulk reads from the port, frames CSV lines and binary frames in place."""
+
+    def __init__(self, size=RING_BUFFER_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.head = 0
+        self.tail = 0
+        self.last_seq = None
+        self.lost_frames = 0
+        self.bad_frames = 0
+        self.replies = []
+
+    def fill(self, ser):
+        # Reads everything the driver has pending (at least one byte, bounded by the port timeout)
+        wanted = max(ser.in_waiting, 1)
+        if self.tail + wanted > len(self.buffer):
+            self._compact()
+            if self.tail == len(self.buffer):
+                print("Ignored invalid line: excede o buffer de receção")
+                self.head = self.tail = 0
+            wanted = min(wanted, len(self.buffer) - self.tail)
+        received = ser.readinto(self.view[self.tail:self.tail + wanted]) or 0
+        self.tail += received
+        return received
+
+    def frames(self):
+        buf = self.buffer
+        while self.head < self.tail:
+            if buf[self.head] == BINARY_SYNC[0]:
+                if self.tail - self.head < BINARY_FRAME.size:
+                    return
+                decoded = unpack_binary_frame(self.buffer, self.head)
+                if decoded is None:
+                    self.bad_frames += 1
+                    self.head += 1
+                    continue
+                self.head += BINARY_FRAME.size
+                self._check_sequence(decoded[0])
+                yield decoded[1]
+                continue
+
+            newline = buf.find(b'\n', self.head, self.tail)
+            sync = buf.find(BINARY_SYNC, self.head, self.tail if newline < 0 else newline)
+            if sync >= 0:
+                # Text before a binary frame is a truncated line: drop it and resync
+                self.head = sync
+                continue
+            if newline < 0:
+                return
+            start, self.head = self.head, newline + 1
+            if newline - start <= 1:
+                continue
+            if buf.startswith(REPLY_PREFIXES, start):
+                try:
+                    self.replies.append(parse_reply_bytes(buf[start:newline]))
+                except ValueError:
+                    self.bad_frames += 1
+                continue
+            try:
+                yield parse_telemetry_bytes(buf[start:newline])
+            except ValueError:
+                print(f"Ignored invalid line: {buf[start:newline].decode('utf-8', errors='replace').strip()}")
+        self.head = self.tail = 0
+
+    def _check_sequence(self, seq):
+        if self.last_seq is not None:
+            self.lost_frames += (seq - self.last_seq - 1) & 0xFFFF
+        self.last_seq = seq
+
+    def _compact(self):
+        # Moves the partial line at the head back to the start of the buffer
+        pending = self.tail - self.head
+        self.view[:pending] = self.view[self.head:self.tail]
+        self.head = 0
+        self.tail = pending
+
+
+# === Serial Link ===
+class SerialLink:
+    """Keeps the telemetry port open, reads continuously and reconnects with backoff.
+
+    Runs as a coroutine on an IOCore. Frames go to `on_frames(frames)` on the loop thread when given,
+    otherwise into a queue that GUI timers drain with get_frames().
+    """
+
+    def __init__(self, port, baud_rate, core, max_queued_frames=MAX_QUEUED_FRAMES, on_frames=None):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.core = core
+        self.on_frames = on_frames
+        self.frames = queue.Queue(maxsize=max_queued_frames)
+        self.replies = asyncio.Queue()
+        self.connected = False
+        self._ser = None
+        self._write_lock = threading.Lock()
+        self._task = None
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = self.core.spawn(self.run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def get_frames(self, timeout=None):
+        # Blocks up to `timeout` for the first frame, then drains whatever else is queued
+        try:
+            frames = [self.frames.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                frames.append(self.frames.get_nowait())
+            except queue.Empty:
+                return frames
+
+    async def next_reply(self, timeout=None):
+        # Next ('ACK'|'NAK', index) from the vehicle, or None after `timeout`
+        try:
+            return await asyncio.wait_for(self.replies.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def write(self, data):
+        ser = self._ser
+        if ser is None:
+            raise serial.SerialException(f"{self.port} não está ligada")
+        with self._write_lock:
+            ser.write(data)
+            ser.flush()
+
+    async def send(self, data):
+        # write() blocks until the bytes are out; keep that off the loop
+        await asyncio.to_thread(self.write, data)
+
+    async def run(self):
+        backoff = MIN_BACKOFF
+        while True:
+            try:
+                ser = await asyncio.to_thread(serial.Serial, self.port, self.baud_rate, timeout=READ_TIMEOUT)
+                with ser:
+                    self._ser = ser
+                    self.connected = True
+                    backoff = MIN_BACKOFF
+                    print(f"[Serial] Ligado a {self.port} a {self.baud_rate} baud")
+                    await self._read_loop(ser)
+            except serial.SerialException as e:
+                print(f"[Serial error] {e} (nova tentativa em {backoff:.1f} s)")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+            finally:
+                self._ser = None
+                self.connected = False
+
+    async def _read_loop(self, ser):
+        ring = TelemetryRingBuffer()
+        while True:
+            # pyserial has no async API; a read waits at most READ_TIMEOUT in the executor
+            if await asyncio.to_thread(ring.fill, ser):
+                frames = list(ring.frames())
+                if frames:
+                    if self.on_frames:
+                        self.on_frames(frames)
+                    else:
+                        for frame in frames:
+                            self._publish(frame)
+                for reply in ring.replies:
+                    self.replies.put_nowait(reply)
+                ring.replies.clear()
+
+    def _publish(self, frame):
+        # Drop the oldest frame rather than stall the reader when the GUI falls behind
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+# === Telemetry Feed ===
+class SimulatedSource:
+    """Calls `step()` every `interval` seconds while selected and hands on the frame it returns."""
+
+    def __init__(self, core, step, interval=1.0, on_frames=None):
+        self.core = core
+        self.step = step
+        self.interval = interval
+        self.on_frames = on_frames
+        self._enabled = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = self.core.spawn(self.run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def set_active(self, active):
+        # Loop thread only; an idle simulator just waits on the event
+        if active:
+            self._enabled.set()
+        else:
+            self._enabled.clear()
+
+    async def run(self):
+        while True:
+            await self._enabled.wait()
+            frame = self.step()
+            if self.on_frames:
+                self.on_frames([frame])
+            await asyncio.sleep(self.interval)
+
+
+class TelemetryFeed:
+    """Forwards frames from the selected source only, so sources never have to be restarted.
+
+    Every source keeps running and delivers through the `on_frames` the feed installs. `select` swaps
+    the active name on the loop thread and applies from the next batch. A source's `tap`, if given, sees
+    every batch from that source whether it is selected or not.
+    """
+
+    def __init__(self, core, consumer):
+        self.core = core
+        self.consumer = consumer
+        self.sources = {}
+        self.active = None
+
+    def add(self, name, source, tap=None):
+        self.sources[name] = source
+        source.on_frames = lambda frames: self._push(name, frames, tap)
+        return source
+
+    def select(self, name):
+        self.core.call_soon(self._select, name)
+
+    def _select(self, name):
+        previous, self.active = self.sources.get(self.active), name
+        for source, active in ((previous, False), (self.sources.get(name), True)):
+            if hasattr(source, 'set_active'):
+                source.set_active(active)
+
+    def _push(self, name, frames, tap=None):
+        if tap is not None:
+            tap(frames)
+        if name == self.active:
+            self.consumer(frames)
+
+
+# === Mission Upload ===
+class MissionUploader:
+    """Uploads waypoints over a SerialLink as a coroutine, keeping up to `window` lines unacknowledged.
+
+    Only waypoints that are NAKed or time out are resent, up to `retries` attempts each.
+    """
+
+    def __init__(self, link, core, window=UPLOAD_WINDOW, ack_timeout=UPLOAD_ACK_TIMEOUT, retries=UPLOAD_RETRIES):
+        self.link = link
+        self.core = core
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self._task = None
+
+    @property
+    def busy(self):
+        return self._task is not None and not self._task.done()
+
+    def upload(self, points, progress=None, done=None):
+        # progress(acked, total) and done(failed_indices) run on the loop thread
+        if self.busy:
+            return False
+        self._task = self.core.spawn(self.run(list(points), progress, done))
+        return True
+
+    def cancel(self):
+        if self._task:
+            self._task.cancel()
+
+    async def run(self, points, progress=None, done=None):
+        total = len(points)
+        pending = collections.deque(range(total))
+        in_flight = {}
+        attempts = [0] * total
+        acked = 0
+        failed = set()
+
+        def retry(index):
+            if attempts[index] < self.retries:
+                pending.append(index)
+            else:
+                failed.add(index)
+
+        # Replies left over from an earlier upload would be matched against this one
+        while not self.link.replies.empty():
+            self.link.replies.get_nowait()
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.window:
+                    index = pending.popleft()
+                    lat, lon = points[index]
+                    attempts[index] += 1
+                    await self.link.send(f"WP,{index + 1},{lat:.6f},{lon:.6f}\n".encode())
+                    in_flight[index] = time.monotonic() + self.ack_timeout
+
+                reply = await self.link.next_reply(max(0.0, min(in_flight.values()) - time.monotonic()))
+                if reply is not None:
+                    kind, index = reply[0], reply[1] - 1
+                    if in_flight.pop(index, None) is not None:
+                        if kind == 'ACK':
+                            acked += 1
+                            if progress:
+                                progress(acked, total)
+                        else:
+                            retry(index)
+                now = time.monotonic()
+                for index in [i for i, deadline in in_flight.items() if deadline <= now]:
+                    del in_flight[index]
+                    retry(index)
+        except serial.SerialException as e:
+            print(f"[Upload] {e}")
+        finally:
+            failed.update(pending, in_flight)
+            if done:
+                done(sorted(failed))
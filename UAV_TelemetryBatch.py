@@ -0,0 +1,119 @@
+# Vectorized decoding of telemetry CSV blocks (serial bursts, recorded captures)
+# === Imports ===
+import argparse
+import io
+import time
+
+import numpy as np
+
+from UAV_Telemetry import TELEMETRY_FIELDS, parse_telemetry_bytes
+
+# === Constants ===
+TELEMETRY_DTYPE = np.dtype([(name, np.float64) for name in TELEMETRY_FIELDS])
+FIELD_SEPARATORS = len(TELEMETRY_FIELDS) - 1
+BLOCK_SIZE = 4 * 1024 * 1024
+SLOW_PATH_ROWS = 64     # a failing run of rows is halved down to this size, then parsed row by row
+
+
+def _decode_rows(rows):
+    # -> (values, ok). One loadtxt pass over all rows; on a ValueError the rows are split in halves so only
+    # the neighbourhood of a bad row is retried, and runs of SLOW_PATH_ROWS or less go row by row
+    try:
+        values = np.loadtxt(io.BytesIO(b'\n'.join(rows)), delimiter=',', comments=None, dtype=np.float64, ndmin=2)
+        return values, np.ones(len(rows), dtype=bool)
+    except ValueError:
+        pass
+    if len(rows) > SLOW_PATH_ROWS:
+        half = len(rows) // 2
+        (head, head_ok), (tail, tail_ok) = _decode_rows(rows[:half]), _decode_rows(rows[half:])
+        return np.concatenate((head, tail)), np.concatenate((head_ok, tail_ok))
+    values = np.full((len(rows), len(TELEMETRY_FIELDS)), np.nan)
+    ok = np.zeros(len(rows), dtype=bool)
+    for i, row in enumerate(rows):
+        try:
+            values[i] = parse_telemetry_bytes(row)
+            ok[i] = True
+        except ValueError:
+            pass
+    return values, ok
+
+
+def decode_telemetry_batch(block):
+    """Decode a block of N telemetry lines into (structured array of N rows, validity mask).
+
+    `block` is bytes with one frame per line or a list of str/bytes lines. Invalid rows, including those
+    with a nan or inf field, are NaN in the array and False in the mask.
+    """
+    if not isinstance(block, (bytes, bytearray, memoryview)):
+        block = b'\n'.join(line.encode() if isinstance(line, str) else bytes(line) for line in block)
+    block = bytes(block)
+    if block.endswith(b'\n'):
+        block = block[:-1]
+    if not block:
+        return np.empty(0, dtype=TELEMETRY_DTYPE), np.zeros(0, dtype=bool)
+
+    rows = block.split(b'\n')
+    raw = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(raw == ord('\n'))
+    ends = np.append(ends, len(raw))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    # Rows with exactly 7 commas are candidates; counted from a prefix sum, no per-row Python
+    commas = np.concatenate(([0], np.cumsum(raw == ord(','))))
+    valid = (commas[ends] - commas[starts]) == FIELD_SEPARATORS
+
+    result = np.full(len(rows), np.nan, dtype=TELEMETRY_DTYPE)
+    selected = np.flatnonzero(valid)
+    if len(selected) == 0:
+        return result, valid
+    candidates = rows if len(selected) == len(rows) else [rows[i] for i in selected]
+
+    values, ok = _decode_rows(candidates)
+    # float() and loadtxt both accept "nan"/"inf", which no real frame carries
+    ok &= np.isfinite(values).all(axis=1)
+    values[~ok] = np.nan
+    result[selected] = values.view(TELEMETRY_DTYPE).reshape(-1)
+    valid[selected] = ok
+    return result, valid
+
+
+def iter_telemetry_file(path, block_size=BLOCK_SIZE):
+    # Decodes a CSV telemetry capture block by block; yields (array, mask) per block
+    with open(path, 'rb') as f:
+        pending = b''
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                break
+            chunk = pending + chunk
+            cut = chunk.rfind(b'\n') + 1
+            pending = chunk[cut:]
+            if cut:
+                yield decode_telemetry_batch(chunk[:cut])
+        if pending:
+            yield decode_telemetry_batch(pending)
+
+
+# === Main ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Descodifica uma captura de telemetria CSV da porta série")
+    parser.add_argument("capture")
+    parser.add_argument("-o", "--output", help="guarda os frames válidos num .npy (array estruturado)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    frames = []
+    total = 0
+    try:
+        for values, mask in iter_telemetry_file(args.capture):
+            total += len(mask)
+            frames.append(values[mask])
+    except OSError as e:
+        parser.exit(1, f"Erro ao ler {args.capture}: {e}\n")
+    frames = np.concatenate(frames) if frames else np.empty(0, dtype=TELEMETRY_DTYPE)
+    elapsed = time.perf_counter() - started
+    print(f"{len(frames)} frames válidos, {total - len(frames)} linhas inválidas, "
+          f"{total / max(elapsed, 1e-9):,.0f} linhas/s")
+    if args.output:
+        np.save(args.output, frames)
+        print(f"Guardado em {args.output}")
@@ -0,0 +1,118 @@
+# Virtual serial link for running the GUI against the simulator locally (Linux pseudo-terminals)
+# === Imports ===
+import argparse
+import json
+import os
+import select
+import threading
+
+# === Constants ===
+# Written by whoever creates the link, read by the GUIs and the simulator at start-up
+PORTS_CONFIG = "uav_ports.json"
+ENV_PREFIX = "UAV_"
+RELAY_CHUNK = 4096
+
+
+def configured_port(key, default, path=PORTS_CONFIG):
+    # UAV_SERIAL_PORT / UAV_SIM_PORT from the environment, then uav_ports.json, then the hard-coded default
+    value = os.environ.get(ENV_PREFIX + key.upper())
+    if value:
+        return value
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get(key) or default
+    except (OSError, ValueError):
+        return default
+
+
+def write_ports_config(serial_port, sim_port, path=PORTS_CONFIG):
+    with open(path, "w") as f:
+        json.dump({"serial_port": serial_port, "sim_port": sim_port}, f)
+
+
+# === Virtual Serial Pair ===
+class VirtualSerialPair:
+    """Two pseudo-terminals joined back to back, like a null-modem cable between two COM ports.
+
+    Each side opens its path with pyserial as if it were real hardware. Bytes nobody is reading are
+    dropped once the pty buffer is full, the way an unread UART overruns, so one side never stalls the other.
+    """
+
+    def __init__(self):
+        self.port_a = self.port_b = None
+        self.dropped = 0
+        self._fds = []
+        self._masters = ()
+        self._stop_r, self._stop_w = None, None
+        self._thread = None
+
+    def open(self):
+        import tty  # POSIX only; keeps configured_port() importable on Windows
+
+        ends = []
+        for _ in range(2):
+            master, slave = os.openpty()
+            # Raw mode before anyone attaches, otherwise the line discipline echoes data back into the relay
+            tty.setraw(slave)
+            os.set_blocking(master, False)
+            ends.append((master, slave, os.ttyname(slave)))
+            # Holding the slave open keeps the master readable while no client is attached
+            self._fds += [master, slave]
+        (master_a, _, self.port_a), (master_b, _, self.port_b) = ends
+        self._masters = (master_a, master_b)
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._relay, name="VirtualSerialPair", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread:
+            os.write(self._stop_w, b'x')
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        for fd in self._fds + [self._stop_r, self._stop_w]:
+            if fd is not None:
+                os.close(fd)
+        self._fds = []
+        self._stop_r = self._stop_w = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _relay(self):
+        master_a, master_b = self._masters
+        peer = {master_a: master_b, master_b: master_a}
+        while True:
+            readable, _, _ = select.select([master_a, master_b, self._stop_r], [], [])
+            if self._stop_r in readable:
+                return
+            for fd in readable:
+                try:
+                    data = os.read(fd, RELAY_CHUNK)
+                except (BlockingIOError, OSError):
+                    continue
+                try:
+                    written = os.write(peer[fd], data)
+                except BlockingIOError:
+                    written = 0
+                self.dropped += len(data) - written
+
+
+# === Main ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cria um par de portas série virtuais (PTY) GUI <-> simulador")
+    parser.add_argument("--config", default=PORTS_CONFIG, help="onde gravar os caminhos das portas")
+    args = parser.parse_args()
+
+    with VirtualSerialPair() as pair:
+        write_ports_config(pair.port_a, pair.port_b, args.config)
+        print(f"GUI: {pair.port_a}\nSimulador: {pair.port_b}\n(caminhos gravados em {args.config}; Ctrl+C para terminar)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(args.config)